@@ -1,14 +1,17 @@
 from pydantic import BaseModel
 import json
 from dotenv import load_dotenv
-from datetime import datetime
-from market import get_share_price
-from database import write_account, read_account, write_log
+import os
+import clock
+from market import get_share_price, get_share_prices
+from database import create_account, write_account, read_account, write_strategy, adjust_balance, execute_trade, write_portfolio_value, write_log
 
 load_dotenv(override=True)
 
 INITIAL_BALANCE = 10_000.0
 SPREAD = 0.002
+# How many of the latest transactions the compact report includes
+REPORT_TRANSACTIONS = int(os.getenv("REPORT_TRANSACTIONS", "10"))
 
 
 class Transaction(BaseModel):
@@ -32,20 +35,18 @@ class Account(BaseModel):
     holdings: dict[str, int]
     transactions: list[Transaction]
     portfolio_value_time_series: list[tuple[str, float]]
+    # Maintained by the database on every trade
+    average_costs: dict[str, float] = {}
+    net_invested: float = 0.0
+    realized_profit_loss: float = 0.0
 
     @classmethod
     def get(cls, name: str):
         fields = read_account(name.lower())
         if not fields:
-            fields = {
-                "name": name.lower(),
-                "balance": INITIAL_BALANCE,
-                "strategy": "",
-                "holdings": {},
-                "transactions": [],
-                "portfolio_value_time_series": []
-            }
-            write_account(name, fields)
+            # Never replace: another process may have just created the account and traded on it
+            create_account(name, INITIAL_BALANCE)
+            fields = read_account(name.lower())
         return cls(**fields)
     
     
@@ -58,85 +59,74 @@ class Account(BaseModel):
         self.holdings = {}
         self.transactions = []
         self.portfolio_value_time_series = []
+        self.average_costs = {}
+        self.net_invested = 0.0
+        self.realized_profit_loss = 0.0
         self.save()
 
+    def refresh(self):
+        """ Reload the account from the database, after a write made there rather than in memory. """
+        fresh = Account.get(self.name)
+        for field in type(self).model_fields:
+            setattr(self, field, getattr(fresh, field))
+
     def deposit(self, amount: float):
         """ Deposit funds into the account. """
         if amount <= 0:
             raise ValueError("Deposit amount must be positive.")
-        self.balance += amount
+        self.balance = adjust_balance(self.name, amount)
         print(f"Deposited ${amount}. New balance: ${self.balance}")
-        self.save()
 
     def withdraw(self, amount: float):
         """ Withdraw funds from the account, ensuring it doesn't go negative. """
-        if amount > self.balance:
-            raise ValueError("Insufficient funds for withdrawal.")
-        self.balance -= amount
+        self.balance = adjust_balance(self.name, -amount)
         print(f"Withdrew ${amount}. New balance: ${self.balance}")
-        self.save()
 
-    def buy_shares(self, symbol: str, quantity: int, rationale: str) -> str:
+    def trade(self, transaction: Transaction, idempotency_key: str | None) -> bool:
+        """ Apply the trade atomically in the database, then bring this object up to date; False if it was a repeat. """
+        executed = execute_trade(self.name, transaction.model_dump(), idempotency_key)
+        self.refresh()
+        return executed
+
+    def buy_shares(self, symbol: str, quantity: int, rationale: str, idempotency_key: str | None = None) -> str:
         """ Buy shares of a stock if sufficient funds are available. """
         price = get_share_price(symbol)
-        buy_price = price * (1 + SPREAD)
-        total_cost = buy_price * quantity
-        
-        if total_cost > self.balance:
-            raise ValueError("Insufficient funds to buy shares.")
-        elif price==0:
+        if price==0:
             raise ValueError(f"Unrecognized symbol {symbol}")
-        
-        # Update holdings
-        self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Record transaction
+        buy_price = price * (1 + SPREAD)
+        timestamp = clock.now().strftime("%Y-%m-%d %H:%M:%S")
         transaction = Transaction(symbol=symbol, quantity=quantity, price=buy_price, timestamp=timestamp, rationale=rationale)
-        self.transactions.append(transaction)
-        
-        # Update balance
-        self.balance -= total_cost
-        self.save()
+        if not self.trade(transaction, idempotency_key):
+            return "Already completed with this idempotency key. Latest details:\n" + self.report()
         write_log(self.name, "account", f"Bought {quantity} of {symbol}")
         return "Completed. Latest details:\n" + self.report()
 
-    def sell_shares(self, symbol: str, quantity: int, rationale: str) -> str:
+    def sell_shares(self, symbol: str, quantity: int, rationale: str, idempotency_key: str | None = None) -> str:
         """ Sell shares of a stock if the user has enough shares. """
-        if self.holdings.get(symbol, 0) < quantity:
-            raise ValueError(f"Cannot sell {quantity} shares of {symbol}. Not enough shares held.")
-        
         price = get_share_price(symbol)
         sell_price = price * (1 - SPREAD)
-        total_proceeds = sell_price * quantity
-        
-        # Update holdings
-        self.holdings[symbol] -= quantity
-        
-        # If shares are completely sold, remove from holdings
-        if self.holdings[symbol] == 0:
-            del self.holdings[symbol]
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Record transaction
-        transaction = Transaction(symbol=symbol, quantity=-quantity, price=sell_price, timestamp=timestamp, rationale=rationale)  # negative quantity for sell
-        self.transactions.append(transaction)
-
-        # Update balance
-        self.balance += total_proceeds
-        self.save()
+        timestamp = clock.now().strftime("%Y-%m-%d %H:%M:%S")
+        # negative quantity for sell
+        transaction = Transaction(symbol=symbol, quantity=-quantity, price=sell_price, timestamp=timestamp, rationale=rationale)
+        if not self.trade(transaction, idempotency_key):
+            return "Already completed with this idempotency key. Latest details:\n" + self.report()
         write_log(self.name, "account", f"Sold {quantity} of {symbol}")
         return "Completed. Latest details:\n" + self.report()
 
-    def calculate_portfolio_value(self):
-        """ Calculate the total value of the user's portfolio. """
+    def calculate_portfolio_value(self, prices: dict[str, float] | None = None):
+        """ Calculate the total value of the user's portfolio, at the given prices if already looked up. """
+        if prices is None:
+            prices = get_share_prices(list(self.holdings))
         total_value = self.balance
         for symbol, quantity in self.holdings.items():
-            total_value += get_share_price(symbol) * quantity
+            total_value += prices.get(symbol, 0.0) * quantity
         return total_value
 
-    def calculate_profit_loss(self, portfolio_value: float):
+    def calculate_profit_loss(self, portfolio_value: float | None = None):
         """ Calculate profit or loss from the initial spend. """
-        initial_spend = sum(transaction.total() for transaction in self.transactions)
-        return portfolio_value - initial_spend - self.balance
+        if portfolio_value is None:
+            portfolio_value = self.calculate_portfolio_value()
+        return portfolio_value - self.net_invested - self.balance
 
     def get_holdings(self):
         """ Report the current holdings of the user. """
@@ -150,27 +140,57 @@ class Account(BaseModel):
         """ List all transactions made by the user. """
         return [transaction.model_dump() for transaction in self.transactions]
     
-    def report(self) -> str:
-        """ Return a json string representing the account.  """
+    def report(self, full: bool = False) -> str:
+        """ Return a json string representing the account: by default a compact summary, or the whole history if full. """
         portfolio_value = self.calculate_portfolio_value()
-        self.portfolio_value_time_series.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), portfolio_value))
-        self.save()
         pnl = self.calculate_profit_loss(portfolio_value)
-        data = self.model_dump()
+        data = self.model_dump() if full else self.summary()
         data["total_portfolio_value"] = portfolio_value
         data["total_profit_loss"] = pnl
-        write_log(self.name, "account", f"Retrieved account details")
         return json.dumps(data)
+
+    def record_portfolio_value(self, portfolio_value: float | None = None) -> float:
+        """ Add the portfolio value (by default at current prices) to the portfolio value time series. """
+        if portfolio_value is None:
+            portfolio_value = self.calculate_portfolio_value()
+        timestamp = clock.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.portfolio_value_time_series.append((timestamp, portfolio_value))
+        write_portfolio_value(self.name, timestamp, portfolio_value)
+        return portfolio_value
+
+    def summary(self) -> dict:
+        """ Holdings with their cost basis, the latest transactions and the realized and unrealized P&L. """
+        prices = get_share_prices(list(self.holdings))
+        holdings = {}
+        for symbol, quantity in self.holdings.items():
+            price = prices.get(symbol, 0.0)
+            average_cost = self.average_costs.get(symbol, price)
+            holdings[symbol] = {
+                "quantity": quantity,
+                "average_cost": round(average_cost, 4),
+                "price": price,
+                "market_value": round(price * quantity, 2),
+                "unrealized_profit_loss": round((price - average_cost) * quantity, 2),
+            }
+        return {
+            "name": self.name,
+            "balance": self.balance,
+            "strategy": self.strategy,
+            "holdings": holdings,
+            "recent_transactions": [transaction.model_dump() for transaction in self.transactions[-REPORT_TRANSACTIONS:]],
+            "transaction_count": len(self.transactions),
+            "realized_profit_loss": round(self.realized_profit_loss, 2),
+            "unrealized_profit_loss": round(sum(holding["unrealized_profit_loss"] for holding in holdings.values()), 2),
+        }
     
     def get_strategy(self) -> str:
         """ Return the strategy of the account """
-        write_log(self.name, "account", f"Retrieved strategy")
         return self.strategy
     
     def change_strategy(self, strategy: str) -> str:
         """ At your discretion, if you choose to, call this to change your investment strategy for the future """
         self.strategy = strategy
-        self.save()
+        write_strategy(self.name, strategy)
         write_log(self.name, "account", f"Changed strategy")
         return "Changed strategy"
 
@@ -1,39 +1,148 @@
+import asyncio
+import uuid
 import mcp
 from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
 from mcp import StdioServerParameters
+from mcp.shared.exceptions import McpError
 from agents import FunctionTool
+from mcp_params import local_server_params, accounts_mcp_url
+from mcp_inprocess import inprocess_session
 import json
+from contextlib import asynccontextmanager
 
-params = StdioServerParameters(command="uv", args=["run", "accounts_server.py"], env=None)
+accounts_params = local_server_params("accounts_server", accounts_mcp_url)
+
+CONNECT_TIMEOUT_SECONDS = 60
+# Tools that change nothing, so they are safe to send again after the session breaks
+READ_ONLY_TOOLS = {"get_balance", "get_holdings", "get_transaction_history"}
+# Tools that accept an idempotency key, so a repeat of the same request is applied only once
+IDEMPOTENT_TOOLS = {"buy_shares", "sell_shares"}
+
+
+class AccountsClient:
+    """
+    A single long-lived session with the accounts server, shared by every caller in this event loop.
+    Concurrent requests are multiplexed over the one session; if the session breaks, it is
+    reopened and the request retried once, unless the caller says a repeat would be unsafe.
+    The session is owned by a dedicated task, so it is opened and closed in the same task.
+    """
+
+    def __init__(self, server_params: dict = accounts_params):
+        """server_params as from local_server_params: a url, an in-process module, or a command to run over stdio"""
+        self.server_params = server_params
+        self.session = None
+        self.loop = None
+        self.task = None
+        self.ready = None
+        self.closing = None
+        self.lock = None
+
+    def _reset_for_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.session = None
+            self.task = None
+            self.ready = asyncio.Event()
+            self.closing = asyncio.Event()
+            self.lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def open_session(self):
+        if "url" in self.server_params:
+            async with streamablehttp_client(self.server_params["url"]) as (read, write, _):
+                async with mcp.ClientSession(read, write) as session:
+                    await session.initialize()
+                    yield session
+        elif "inprocess" in self.server_params:
+            async with inprocess_session(self.server_params["inprocess"]) as session:
+                yield session
+        else:
+            async with stdio_client(StdioServerParameters(**self.server_params)) as streams:
+                async with mcp.ClientSession(*streams) as session:
+                    await session.initialize()
+                    yield session
+
+    async def _run(self) -> None:
+        try:
+            async with self.open_session() as session:
+                self.session = session
+                self.ready.set()
+                await self.closing.wait()
+        finally:
+            self.session = None
+            self.ready.set()
+
+    async def connect(self) -> mcp.ClientSession:
+        self._reset_for_loop()
+        async with self.lock:
+            if self.session is None:
+                if self.task is not None:
+                    await self._stop()
+                self.ready.clear()
+                self.closing.clear()
+                self.task = asyncio.create_task(self._run())
+                await asyncio.wait_for(self.ready.wait(), timeout=CONNECT_TIMEOUT_SECONDS)
+                if self.session is None:
+                    await self.task  # Raises the reason the session could not be opened
+                    raise ConnectionError("Could not connect to the accounts server")
+            return self.session
+
+    async def _stop(self) -> None:
+        self.closing.set()
+        try:
+            await self.task
+        except Exception:
+            pass
+        self.task = None
+        self.session = None
+
+    async def close(self) -> None:
+        if self.task is not None and self.loop is asyncio.get_running_loop():
+            async with self.lock:
+                await self._stop()
+
+    async def request(self, call, retry: bool = True):
+        session = await self.connect()
+        try:
+            return await call(session)
+        except McpError:
+            raise
+        except Exception as e:
+            print(f"Accounts server session failed ({e}); reconnecting")
+            async with self.lock:
+                if self.session is session:
+                    await self._stop()
+            if not retry:
+                # The server may already have applied the call, so sending it again could repeat it
+                raise
+            session = await self.connect()
+            return await call(session)
+
+
+accounts_client = AccountsClient()
 
 
 async def list_accounts_tools():
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            tools_result = await session.list_tools()
-            return tools_result.tools
-        
+    tools_result = await accounts_client.request(lambda session: session.list_tools())
+    return tools_result.tools
+
 async def call_accounts_tool(tool_name, tool_args):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.call_tool(tool_name, tool_args)
-            return result
-            
-async def read_accounts_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://accounts_server/{name}")
-            return result.contents[0].text
-        
+    """Call a tool; trades get an idempotency key if they have none, so a retry cannot trade twice"""
+    if tool_name in IDEMPOTENT_TOOLS and not tool_args.get("idempotency_key"):
+        tool_args = {**tool_args, "idempotency_key": uuid.uuid4().hex}
+    retry = tool_name in READ_ONLY_TOOLS or tool_name in IDEMPOTENT_TOOLS
+    return await accounts_client.request(lambda session: session.call_tool(tool_name, tool_args), retry=retry)
+
+async def read_accounts_resource(name, full=False):
+    uri = f"accounts://accounts_server/{name}/full" if full else f"accounts://accounts_server/{name}"
+    result = await accounts_client.request(lambda session: session.read_resource(uri))
+    return result.contents[0].text
+
 async def read_strategy_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://strategy/{name}")
-            return result.contents[0].text
+    result = await accounts_client.request(lambda session: session.read_resource(f"accounts://strategy/{name}"))
+    return result.contents[0].text
 
 async def get_accounts_tools_openai():
     openai_tools = []
@@ -44,7 +153,7 @@ async def get_accounts_tools_openai():
             description=tool.description,
             params_json_schema=schema,
             on_invoke_tool=lambda ctx, args, toolname=tool.name: call_accounts_tool(toolname, json.loads(args))
-                
+
         )
         openai_tools.append(openai_tool)
-    return openai_tools
\ No newline at end of file
+    return openai_tools
@@ -1,7 +1,16 @@
+import os
+import sys
+import asyncio
 from mcp.server.fastmcp import FastMCP
 from accounts import Account
+from database import flush_logs_on_terminate
 
-mcp = FastMCP("accounts_server")
+# Run with no arguments for stdio, or `uv run accounts_server.py streamable-http` to serve it over HTTP
+# on ACCOUNTS_SERVER_PORT (default 8001) so that many processes can share one warm server.
+# Every tool does blocking SQLite work, and may look up prices over HTTP, so it runs in a worker thread;
+# mounted in-process, the server shares the trading floor's event loop
+
+mcp = FastMCP("accounts_server", host=os.getenv("MCP_SERVER_HOST", "127.0.0.1"), port=int(os.getenv("ACCOUNTS_SERVER_PORT", "8001")))
 
 @mcp.tool()
 async def get_balance(name: str) -> float:
@@ -10,7 +19,7 @@ async def get_balance(name: str) -> float:
     Args:
         name: The name of the account holder
     """
-    return Account.get(name).balance
+    return await asyncio.to_thread(lambda: Account.get(name).balance)
 
 @mcp.tool()
 async def get_holdings(name: str) -> dict[str, int]:
@@ -19,10 +28,19 @@ async def get_holdings(name: str) -> dict[str, int]:
     Args:
         name: The name of the account holder
     """
-    return Account.get(name).holdings
+    return await asyncio.to_thread(lambda: Account.get(name).holdings)
+
+@mcp.tool()
+async def get_transaction_history(name: str) -> list[dict]:
+    """Get every transaction ever made by the given account name; your account details only include the latest ones.
+
+    Args:
+        name: The name of the account holder
+    """
+    return await asyncio.to_thread(lambda: Account.get(name).list_transactions())
 
 @mcp.tool()
-async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
+async def buy_shares(name: str, symbol: str, quantity: int, rationale: str, idempotency_key: str | None = None) -> float:
     """Buy shares of a stock.
 
     Args:
@@ -30,12 +48,13 @@ async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> f
         symbol: The symbol of the stock
         quantity: The quantity of shares to buy
         rationale: The rationale for the purchase and fit with the account's strategy
+        idempotency_key: Optional unique id for this purchase; repeating a request with the same key does not buy again
     """
-    return Account.get(name).buy_shares(symbol, quantity, rationale)
+    return await asyncio.to_thread(lambda: Account.get(name).buy_shares(symbol, quantity, rationale, idempotency_key))
 
 
 @mcp.tool()
-async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
+async def sell_shares(name: str, symbol: str, quantity: int, rationale: str, idempotency_key: str | None = None) -> float:
     """Sell shares of a stock.
 
     Args:
@@ -43,8 +62,9 @@ async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) ->
         symbol: The symbol of the stock
         quantity: The quantity of shares to sell
         rationale: The rationale for the sale and fit with the account's strategy
+        idempotency_key: Optional unique id for this sale; repeating a request with the same key does not sell again
     """
-    return Account.get(name).sell_shares(symbol, quantity, rationale)
+    return await asyncio.to_thread(lambda: Account.get(name).sell_shares(symbol, quantity, rationale, idempotency_key))
 
 @mcp.tool()
 async def change_strategy(name: str, strategy: str) -> str:
@@ -54,17 +74,20 @@ async def change_strategy(name: str, strategy: str) -> str:
         name: The name of the account holder
         strategy: The new strategy for the account
     """
-    return Account.get(name).change_strategy(strategy)
+    return await asyncio.to_thread(lambda: Account.get(name).change_strategy(strategy))
 
 @mcp.resource("accounts://accounts_server/{name}")
 async def read_account_resource(name: str) -> str:
-    account = Account.get(name.lower())
-    return account.report()
+    return await asyncio.to_thread(lambda: Account.get(name.lower()).report())
+
+@mcp.resource("accounts://accounts_server/{name}/full")
+async def read_full_account_resource(name: str) -> str:
+    return await asyncio.to_thread(lambda: Account.get(name.lower()).report(full=True))
 
 @mcp.resource("accounts://strategy/{name}")
 async def read_strategy_resource(name: str) -> str:
-    account = Account.get(name.lower())
-    return account.get_strategy()
+    return await asyncio.to_thread(lambda: Account.get(name.lower()).get_strategy())
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
\ No newline at end of file
+    flush_logs_on_terminate()
+    mcp.run(transport=sys.argv[1] if len(sys.argv) > 1 else "stdio")
\ No newline at end of file
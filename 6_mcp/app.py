@@ -1,10 +1,21 @@
+import asyncio
+import html
+import os
 import gradio as gr
 from util import css, js, Color
 import pandas as pd
-from trading_floor import names, lastnames, short_model_names
+from trading_floor import load_registry
 import plotly.express as px
 from accounts import Account
-from database import read_log
+from market import get_share_prices
+from database import account_version, latest_account_version
+from dashboard import log_feed, SnapshotCache
+
+LOG_HEARTBEAT_SECONDS = 15
+MAX_LOG_LINES = 100
+REFRESH_SECONDS = 10
+PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "4"))
+SUMMARY = "summary"
 
 mapper = {
     "trace": Color.WHITE,
@@ -13,6 +24,8 @@ mapper = {
     "generation": Color.YELLOW,
     "response": Color.MAGENTA,
     "account": Color.RED,
+    "usage": Color.BLUE,
+    "schedule": Color.CYAN,
 }
 
 
@@ -57,10 +70,19 @@ class Trader:
         """Convert holdings to DataFrame for display"""
         holdings = self.account.get_holdings()
         if not holdings:
-            return pd.DataFrame(columns=["Symbol", "Quantity"])
+            return pd.DataFrame(columns=["Symbol", "Quantity", "Avg Cost", "P&L"])
 
+        prices = get_share_prices(list(holdings))
         df = pd.DataFrame(
-            [{"Symbol": symbol, "Quantity": quantity} for symbol, quantity in holdings.items()]
+            [
+                {
+                    "Symbol": symbol,
+                    "Quantity": quantity,
+                    "Avg Cost": round(self.account.average_costs.get(symbol, 0.0), 2),
+                    "P&L": round((prices.get(symbol, 0.0) - self.account.average_costs.get(symbol, 0.0)) * quantity, 2),
+                }
+                for symbol, quantity in holdings.items()
+            ]
         )
         return df
 
@@ -80,51 +102,89 @@ class Trader:
         emoji = "⬆" if pnl >= 0 else "⬇"
         return f"<div style='text-align: center;background-color:{color};'><span style='font-size:32px'>${portfolio_value:,.0f}</span><span style='font-size:24px'>&nbsp;&nbsp;&nbsp;{emoji}&nbsp;${pnl:,.0f}</span></div>"
 
-    def get_logs(self, previous=None) -> str:
-        logs = read_log(self.name, last_n=13)
-        response = ""
-        for log in logs:
-            timestamp, type, message = log
-            color = mapper.get(type, Color.WHITE).value
-            response += f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>"
-        response = f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
-        if response != previous:
-            return response
-        return gr.update()
-
-
-class TraderView:
-    def __init__(self, trader: Trader):
-        self.trader = trader
-        self.portfolio_value = None
-        self.chart = None
-        self.holdings_table = None
-        self.transactions_table = None
+    def build_snapshot(self) -> tuple:
+        """Everything the dashboard shows for this trader apart from the logs, computed once for all sessions"""
+        self.reload()
+        return (
+            self.get_portfolio_value(),
+            self.get_portfolio_value_chart(),
+            self.get_holdings_df(),
+            self.get_transactions_df(),
+        )
+
 
-    def make_ui(self):
-        with gr.Column():
-            gr.HTML(self.trader.get_title())
+
+def get_log_lines(items) -> str:
+    response = ""
+    for name, (id, timestamp, type, message) in items:
+        color = mapper.get(type, Color.WHITE).value
+        response += f"<div data-id='{id}' data-trader='{name}' style='color:{color}'>{timestamp} : [{type}] {html.escape(message)}</div>"
+    return response
+
+
+def get_log_panel(trader: Trader | None, backlog=()) -> str:
+    name = trader.name.lower() if trader else ""
+    return f"<div class='log-panel' data-trader='{name}' style='height:250px; overflow-y:auto;'><div class='log-lines'>{get_log_lines(backlog)}</div></div>"
+
+
+# Client-side handler that routes each pushed batch of log lines to the panel of the trader it belongs to
+log_append_js = f"""(chunk) => {{
+    const batch = document.createElement('template');
+    batch.innerHTML = chunk || '';
+    for (const line of Array.from(batch.content.children)) {{
+        const lines = document.querySelector(`.log-panel[data-trader="${{line.dataset.trader}}"] .log-lines`);
+        if (!lines || lines.querySelector(`[data-id="${{line.dataset.id}}"]`)) continue;
+        lines.appendChild(line);
+        while (lines.childElementCount > {MAX_LOG_LINES}) lines.firstElementChild.remove();
+        lines.parentElement.scrollTop = lines.parentElement.scrollHeight;
+    }}
+    return [];
+}}"""
+
+
+def build_summary(traders: list[Trader]) -> pd.DataFrame:
+    """One row per trader, valued with a single batched price lookup across every holding on the floor"""
+    accounts = [Account.get(trader.name) for trader in traders]
+    prices = get_share_prices(sorted({symbol for account in accounts for symbol in account.holdings}))
+    rows = []
+    for trader, account in zip(traders, accounts):
+        value = account.balance + sum(prices.get(symbol, 0.0) * quantity for symbol, quantity in account.holdings.items())
+        rows.append({
+            "Trader": trader.name,
+            "Model": trader.model_name,
+            "Value": round(value, 2),
+            "P&L": round(account.calculate_profit_loss(value), 2),
+            "Positions": len(account.holdings),
+        })
+    return pd.DataFrame(rows, columns=["Trader", "Model", "Value", "P&L", "Positions"])
+
+
+class TraderSlot:
+    """One of the PAGE_SIZE columns on the dashboard, showing whichever trader is on that spot of the current page"""
+
+    def __init__(self, index: int):
+        self.index = index
+
+    def make_ui(self, trader: Trader | None):
+        with gr.Column(visible=trader is not None) as self.column:
+            self.title = gr.HTML(trader.get_title() if trader else "")
             with gr.Row():
-                self.portfolio_value = gr.HTML(self.trader.get_portfolio_value)
+                self.portfolio_value = gr.HTML()
             with gr.Row():
-                self.chart = gr.Plot(
-                    self.trader.get_portfolio_value_chart, container=True, show_label=False
-                )
+                self.chart = gr.Plot(container=True, show_label=False)
             with gr.Row(variant="panel"):
-                self.log = gr.HTML(self.trader.get_logs)
+                self.log = gr.HTML(get_log_panel(trader))
             with gr.Row():
                 self.holdings_table = gr.Dataframe(
-                    value=self.trader.get_holdings_df,
                     label="Holdings",
-                    headers=["Symbol", "Quantity"],
+                    headers=["Symbol", "Quantity", "Avg Cost", "P&L"],
                     row_count=(5, "dynamic"),
-                    col_count=2,
+                    col_count=4,
                     max_height=300,
                     elem_classes=["dataframe-fix-small"],
                 )
             with gr.Row():
                 self.transactions_table = gr.Dataframe(
-                    value=self.trader.get_transactions_df,
                     label="Recent Transactions",
                     headers=["Timestamp", "Symbol", "Quantity", "Price", "Rationale"],
                     row_count=(5, "dynamic"),
@@ -133,36 +193,128 @@ class TraderView:
                     elem_classes=["dataframe-fix"],
                 )
 
-        timer = gr.Timer(value=120)
-        timer.tick(
+    @property
+    def snapshot_outputs(self) -> list:
+        return [self.portfolio_value, self.chart, self.holdings_table, self.transactions_table]
+
+    @property
+    def page_outputs(self) -> list:
+        return [self.column, self.title, self.log]
+
+
+class Dashboard:
+    """
+    Every registered trader, a page of PAGE_SIZE at a time, above a summary table of the whole floor.
+    Each session has one log stream, which follows whichever page the session is looking at.
+    """
+
+    def __init__(self, traders: list[Trader]):
+        self.traders = traders
+        by_name = {trader.name: trader for trader in traders}
+        self.snapshots = SnapshotCache(
+            build=lambda name: build_summary(traders) if name == SUMMARY else by_name[name].build_snapshot(),
+            signature=lambda name: latest_account_version() if name == SUMMARY else account_version(name),
+        )
+        self.slots = [TraderSlot(i) for i in range(PAGE_SIZE)]
+        self.pages = max(1, -(-len(traders) // PAGE_SIZE))
+        self.subscriptions = {}
+
+    def page_traders(self, page: int) -> list[Trader | None]:
+        traders = self.traders[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+        return traders + [None] * (PAGE_SIZE - len(traders))
+
+    def page_label(self, page: int) -> str:
+        traders = [trader for trader in self.page_traders(page) if trader]
+        return f"Page {page + 1}: {traders[0].name} - {traders[-1].name}" if traders else f"Page {page + 1}"
+
+    def make_ui(self):
+        self.summary = gr.Dataframe(
+            label="Trading floor",
+            headers=["Trader", "Model", "Value", "P&L", "Positions"],
+            max_height=250,
+        )
+        self.page_dropdown = gr.Dropdown(
+            choices=[(self.page_label(page), page) for page in range(self.pages)],
+            value=0,
+            label="Traders",
+            visible=self.pages > 1,
+        )
+        with gr.Row():
+            for slot, trader in zip(self.slots, self.page_traders(0)):
+                slot.make_ui(trader)
+        self.log_chunk = gr.Textbox(visible=False)
+
+        page = gr.State(0)
+        seen = gr.State(())
+        snapshot_outputs = [output for slot in self.slots for output in slot.snapshot_outputs]
+        self.page_dropdown.change(
+            fn=self.change_page,
+            inputs=[self.page_dropdown],
+            outputs=[page, seen] + [output for slot in self.slots for output in slot.page_outputs],
+            show_progress="hidden",
+        ).then(
             fn=self.refresh,
-            inputs=[],
-            outputs=[
-                self.portfolio_value,
-                self.chart,
-                self.holdings_table,
-                self.transactions_table,
-            ],
+            inputs=[page, seen],
+            outputs=[self.summary] + snapshot_outputs + [seen],
             show_progress="hidden",
-            queue=False,
         )
-        log_timer = gr.Timer(value=0.5)
-        log_timer.tick(
-            fn=self.trader.get_logs,
-            inputs=[self.log],
-            outputs=[self.log],
+        timer = gr.Timer(value=REFRESH_SECONDS)
+        timer.tick(
+            fn=self.refresh,
+            inputs=[page, seen],
+            outputs=[self.summary] + snapshot_outputs + [seen],
             show_progress="hidden",
             queue=False,
         )
+        self.log_chunk.change(fn=None, inputs=[self.log_chunk], outputs=[], js=log_append_js)
+        return page, seen, snapshot_outputs
 
-    def refresh(self):
-        self.trader.reload()
-        return (
-            self.trader.get_portfolio_value(),
-            self.trader.get_portfolio_value_chart(),
-            self.trader.get_holdings_df(),
-            self.trader.get_transactions_df(),
-        )
+    def refresh(self, page: int, seen: tuple):
+        """Send this session the shared snapshots, but only those rebuilt since the session last saw them"""
+        keys = [SUMMARY] + [trader.name for trader in self.page_traders(page) if trader]
+        generations = []
+        outputs = []
+        previous = dict(seen)
+        for key in keys:
+            generation, snapshot = self.snapshots.get(key)
+            generations.append((key, generation))
+            if previous.get(key) == generation:
+                outputs.append((gr.update(),) if key == SUMMARY else (gr.update(),) * 4)
+            else:
+                outputs.append((snapshot,) if key == SUMMARY else snapshot)
+        outputs += [(gr.update(),) * 4] * (PAGE_SIZE + 1 - len(keys))
+        return tuple(value for output in outputs for value in output) + (tuple(generations),)
+
+    async def change_page(self, page: int, request: gr.Request):
+        traders = self.page_traders(page)
+        names = [trader.name for trader in traders if trader]
+        subscription = self.subscriptions.get(request.session_hash)
+        backlog = log_feed.watch(subscription, names) if subscription else []
+        outputs = []
+        for trader in traders:
+            outputs += [
+                gr.update(visible=trader is not None),
+                trader.get_title() if trader else "",
+                get_log_panel(trader, [item for item in backlog if trader and item[0] == trader.name.lower()]),
+            ]
+        return (page, ()) + tuple(outputs)
+
+    async def stream_logs(self, page: int, request: gr.Request):
+        """Push only newly written log lines for the traders on this session's page, from the shared log feed"""
+        names = [trader.name for trader in self.page_traders(page) if trader]
+        backlog, subscription = log_feed.subscribe(names)
+        self.subscriptions[request.session_hash] = subscription
+        try:
+            yield get_log_lines(backlog)
+            while True:
+                try:
+                    items = await asyncio.wait_for(subscription.updates.get(), timeout=LOG_HEARTBEAT_SECONDS)
+                    yield get_log_lines(items)
+                except asyncio.TimeoutError:
+                    yield gr.update()
+        finally:
+            log_feed.unsubscribe(subscription)
+            self.subscriptions.pop(request.session_hash, None)
 
 
 # Main UI construction
@@ -170,17 +322,28 @@ def create_ui():
     """Create the main Gradio UI for the trading simulation"""
 
     traders = [
-        Trader(trader_name, lastname, model_name)
-        for trader_name, lastname, model_name in zip(names, lastnames, short_model_names)
+        Trader(trader["name"], trader["lastname"], trader["short_model_name"])
+        for trader in load_registry()
     ]
-    trader_views = [TraderView(trader) for trader in traders]
+    dashboard = Dashboard(traders)
 
     with gr.Blocks(
         title="Traders", css=css, js=js, theme=gr.themes.Default(primary_hue="sky"), fill_width=True
     ) as ui:
-        with gr.Row():
-            for trader_view in trader_views:
-                trader_view.make_ui()
+        page, seen, snapshot_outputs = dashboard.make_ui()
+        ui.load(
+            fn=dashboard.refresh,
+            inputs=[page, seen],
+            outputs=[dashboard.summary] + snapshot_outputs + [seen],
+            show_progress="hidden",
+        )
+        ui.load(
+            fn=dashboard.stream_logs,
+            inputs=[page],
+            outputs=[dashboard.log_chunk],
+            show_progress="hidden",
+            concurrency_limit=None,
+        )
 
     return ui
 
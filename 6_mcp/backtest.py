@@ -0,0 +1,130 @@
+"""
+Backtest the traders against stored market history, one simulated trading day at a time.
+
+    uv run backtest.py --start 2025-01-02 --end 2025-03-31 --workers 4
+    uv run backtest.py --start 2025-01-02 --end 2025-03-31 --trader Warren --model gpt-4.1-mini --backfill
+
+Each trader is replayed in its own worker process with a fresh account, named like warren-bt12.
+The clock is set to each stored date in turn, so account timestamps, prompts and share prices are
+all as of that day. The accounts and market servers are mounted in-process so they share the
+simulated clock. There is no researcher, since it could only find today's news, and the trader
+is told not to use what it knows about anything after the simulated date.
+The portfolio value at the end of each day is stored in backtest_equity.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import AsyncExitStack
+from datetime import date, datetime, time
+from agents import Agent, Runner, RunConfig
+import clock
+from accounts import Account, INITIAL_BALANCE
+from database import (
+    create_backtest_run,
+    read_backtest_run,
+    write_backtest_equity,
+    finish_backtest_run,
+    read_price_dates,
+)
+from market import backfill_market_history
+from market_calendar import get_calendar
+from mcp_pool import create_mcp_server
+from templates import backtest_instructions, trade_message, rebalance_message
+from traders import get_model, MAX_TURNS
+from trading_floor import load_registry
+
+BACKTEST_MCP_SERVER_PARAMS = [{"inprocess": "accounts_server"}, {"inprocess": "market_server"}]
+TRADING_TIME = time(10, 0)
+CLOSING_TIME = time(16, 0)
+
+
+async def backtest(run_id: int, dates: list[str]) -> float:
+    run = read_backtest_run(run_id)
+    name, model_name = run["account"], run["model_name"]
+    Account.get(name).reset(run["strategy"])
+    value = INITIAL_BALANCE
+    do_trade = True
+    async with AsyncExitStack() as stack:
+        mcp_servers = [await stack.enter_async_context(create_mcp_server(params)) for params in BACKTEST_MCP_SERVER_PARAMS]
+        for day in dates:
+            clock.set_time(datetime.combine(date.fromisoformat(day), TRADING_TIME))
+            account = Account.get(name)
+            make_message = trade_message if do_trade else rebalance_message
+            agent = Agent(
+                name=name,
+                instructions=backtest_instructions(name),
+                model=get_model(model_name),
+                mcp_servers=mcp_servers,
+            )
+            try:
+                await Runner.run(
+                    agent,
+                    make_message(name, account.strategy, account.report()),
+                    max_turns=MAX_TURNS,
+                    run_config=RunConfig(tracing_disabled=True),
+                )
+            except Exception as e:
+                print(f"Backtest {run_id} ({name}) failed to trade on {day}: {e}")
+            do_trade = not do_trade
+            clock.set_time(datetime.combine(date.fromisoformat(day), CLOSING_TIME))
+            value = Account.get(name).record_portfolio_value()
+            write_backtest_equity(run_id, day, value)
+    return value
+
+
+def run_backtest(run_id: int, dates: list[str]) -> float | None:
+    """Entry point for a worker process"""
+    try:
+        value = asyncio.run(backtest(run_id, dates))
+    except Exception as e:
+        print(f"Backtest {run_id} failed: {e}")
+        finish_backtest_run(run_id, "failed", None)
+        return None
+    finish_backtest_run(run_id, "finished", value)
+    return value
+
+
+def main(args) -> None:
+    start, end = date.fromisoformat(args.start), date.fromisoformat(args.end)
+    if args.backfill:
+        print(f"Stored prices for {backfill_market_history(start, end)} more dates")
+    # Holidays stored by older backfills are not trading days
+    calendar = get_calendar()
+    dates = [day for day in read_price_dates(args.start, args.end) if calendar.is_trading_day(date.fromisoformat(day))]
+    if not dates:
+        print(f"No stored prices between {args.start} and {args.end}; run again with --backfill")
+        return
+    wanted = {name.lower() for name in args.trader}
+    traders = [trader for trader in load_registry() if not wanted or trader["name"].lower() in wanted]
+    runs = {}
+    for trader in traders:
+        strategy = args.strategy or Account.get(trader["name"]).strategy
+        model_name = args.model or trader["model_name"]
+        run_id = create_backtest_run(trader["name"], model_name, strategy, args.start, args.end)
+        runs[run_id] = trader["name"]
+    print(f"Backtesting {len(runs)} traders over {len(dates)} trading days with {args.workers} workers")
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as executor:
+        futures = {executor.submit(run_backtest, run_id, dates): run_id for run_id in runs}
+        for future in as_completed(futures):
+            run_id = futures[future]
+            value = future.result()
+            if value is None:
+                print(f"Run {run_id} ({runs[run_id]}) failed")
+            else:
+                change = (value - INITIAL_BALANCE) / INITIAL_BALANCE
+                print(f"Run {run_id} ({runs[run_id]}) finished at ${value:,.0f} ({change:+.1%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--start", required=True, help="first date to replay, YYYY-MM-DD")
+    parser.add_argument("--end", required=True, help="last date to replay, YYYY-MM-DD")
+    parser.add_argument("--trader", action="append", default=[], help="backtest only this trader (repeatable)")
+    parser.add_argument("--model", help="use this model instead of each trader's own")
+    parser.add_argument("--strategy", help="use this strategy instead of each trader's current one")
+    parser.add_argument("--workers", type=int, default=4, help="traders to backtest at once, each in its own process")
+    parser.add_argument("--backfill", action="store_true", help="fetch and store any missing history from Polygon first")
+    main(parser.parse_args())
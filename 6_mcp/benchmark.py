@@ -0,0 +1,309 @@
+"""
+Benchmark the trading floor's own overhead, with the LLM replaced by a scripted fake model.
+
+    uv run benchmark.py --traders 8 --cycles 5
+    uv run benchmark.py --traders 8 --cycles 5 --transport inprocess --pool
+
+Each cycle runs every benchmark trader once, concurrently. Every trader reads its account and
+strategy, then its fake model makes a realistic sequence of tool calls: holdings, a price lookup,
+a buy and a sell. The run reports latency percentiles for each phase and each tool. It also
+reports how many rows each table grew by, how many writes were made to accounts, processes
+spawned and peak memory. Results are appended
+to benchmark_results.jsonl so they can be compared across commits.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import string
+import subprocess
+import time
+from collections import defaultdict
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime, timezone
+import psutil
+from agents import Model, ModelResponse, Usage, set_trace_processors, trace
+from openai.types.responses import ResponseFunctionToolCall, ResponseOutputMessage, ResponseOutputText
+import traders
+import accounts_client
+from accounts import Account
+from benchmark_transport import percentile
+from database import get_connection, flush_logs
+from mcp_pool import MCPServerPool, create_mcp_server
+from tracers import LogTracer, make_trace_id
+
+RESULTS_FILE = "benchmark_results.jsonl"
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "TSLA", "JPM", "XOM", "SPY"]
+COUNTED_TABLES = ["transactions", "holdings", "portfolio_snapshots", "logs", "usage"]
+SAMPLE_SECONDS = 0.05
+
+
+class Timings:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    def record(self, phase: str, seconds: float) -> None:
+        self.samples[phase].append(seconds * 1000)
+
+    @asynccontextmanager
+    async def phase(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        return {
+            phase: {
+                "count": len(values),
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "p99_ms": percentile(values, 99),
+                "max_ms": max(values),
+            }
+            for phase, values in sorted(self.samples.items())
+        }
+
+
+timings = Timings()
+
+
+class ScriptedModel(Model):
+    """
+    Stands in for the LLM: each run it calls a scripted sequence of the tools it has been given,
+    one per turn, then replies with a short appraisal. The time between turns is the tool's latency.
+    """
+
+    def __init__(self, name: str, latency_seconds: float = 0.0, seed: int = 0):
+        self.name = name
+        self.latency_seconds = latency_seconds
+        self.random = random.Random(f"{seed}-{name}")
+        self.script = []
+        self.pending = None
+
+    def make_script(self) -> list[tuple[str, dict]]:
+        symbol = self.random.choice(SYMBOLS)
+        quantity = self.random.randint(1, 5)
+        return [
+            ("get_holdings", {"name": self.name}),
+            ("lookup_share_price", {"symbol": symbol}),
+            ("buy_shares", {"name": self.name, "symbol": symbol, "quantity": quantity, "rationale": "Benchmark"}),
+            ("sell_shares", {"name": self.name, "symbol": symbol, "quantity": 1, "rationale": "Benchmark"}),
+        ]
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs):
+        step = 0 if isinstance(input, str) else sum(1 for item in input if item.get("type") == "function_call_output")
+        if self.pending:
+            timings.record(f"tool:{self.pending[0]}", time.perf_counter() - self.pending[1])
+            self.pending = None
+        if step == 0:
+            available = {tool.name for tool in tools}
+            self.script = [(tool, arguments) for tool, arguments in self.make_script() if tool in available]
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        call_id = "".join(self.random.choices(string.ascii_lowercase + string.digits, k=24))
+        if step < len(self.script):
+            tool, arguments = self.script[step]
+            self.pending = (tool, time.perf_counter())
+            output = [
+                ResponseFunctionToolCall(
+                    id=f"fc_{call_id}", call_id=f"call_{call_id}", name=tool, arguments=json.dumps(arguments), type="function_call"
+                )
+            ]
+        else:
+            text = ResponseOutputText(text="Benchmark cycle complete.", type="output_text", annotations=[])
+            output = [ResponseOutputMessage(id=f"msg_{call_id}", content=[text], role="assistant", status="completed", type="message")]
+        return ModelResponse(output=output, usage=Usage(requests=1), response_id=None)
+
+    def stream_response(self, *args, **kwargs):
+        raise NotImplementedError("The scripted model does not stream")
+
+
+def bench_names(count: int) -> list[str]:
+    """Trader names made only of letters, since trace ids use 0 to mark the end of the name"""
+    names = []
+    for i in range(count):
+        suffix = ""
+        while True:
+            suffix = string.ascii_lowercase[i % 26] + suffix
+            i = i // 26 - 1
+            if i < 0:
+                break
+        names.append(f"bench{suffix}")
+    return names
+
+
+class ResourceSampler:
+    """Samples this process and its children in the background: every child pid seen, and peak memory"""
+
+    def __init__(self):
+        self.process = psutil.Process()
+        self.children: set[int] = set()
+        self.peak_rss = 0
+        self.task = None
+
+    def sample(self) -> None:
+        children = self.process.children(recursive=True)
+        self.children.update(child.pid for child in children)
+        rss = self.process.memory_info().rss
+        for child in children:
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak_rss = max(self.peak_rss, rss)
+
+    async def run(self) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(SAMPLE_SECONDS)
+
+    def __enter__(self):
+        self.sample()
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.task.cancel()
+        self.sample()
+
+
+def count_rows() -> dict[str, int]:
+    """Rows in each table; updates and deletes don't change these, so only growth can be measured"""
+    flush_logs()
+    conn = get_connection()
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in COUNTED_TABLES}
+
+
+def account_version() -> int:
+    """Every write to an account bumps the global version by one, so its change counts the writes"""
+    return get_connection().execute("SELECT COALESCE(MAX(version), 0) FROM accounts").fetchone()[0]
+
+
+def benchmark_server_params(transport: str) -> list[dict]:
+    """Our own accounts and market servers; the push server is left out so the benchmark sends no notifications"""
+    if transport == "inprocess":
+        return [{"inprocess": "accounts_server"}, {"inprocess": "market_server"}]
+    return [{"command": "uv", "args": ["run", f"{module}.py"]} for module in ("accounts_server", "market_server")]
+
+
+async def run_cycle(trader: traders.Trader, transport: str, pool: MCPServerPool | None) -> None:
+    async with timings.phase("cycle"):
+        async with AsyncExitStack() as stack:
+            async with timings.phase("mcp_servers"):
+                if pool:
+                    servers = await pool.get_trader_servers()
+                else:
+                    servers = [
+                        await stack.enter_async_context(create_mcp_server(params))
+                        for params in benchmark_server_params(transport)
+                    ]
+            with trace(f"{trader.name}-benchmark", trace_id=make_trace_id(trader.name)):
+                await trader.run_agent(servers, [])
+
+
+def instrument() -> None:
+    """Time the phases of a trader's run that happen outside the model and its tool calls"""
+    for phase, method in [("create_agent", "create_agent"), ("account_report", "get_account_report")]:
+        original = getattr(traders.Trader, method)
+
+        async def timed(self, *args, _original=original, _phase=phase, **kwargs):
+            async with timings.phase(_phase):
+                return await _original(self, *args, **kwargs)
+
+        setattr(traders.Trader, method, timed)
+    original_run = traders.Runner.run
+
+    async def timed_run(*args, **kwargs):
+        async with timings.phase("agent_run"):
+            return await original_run(*args, **kwargs)
+
+    traders.Runner.run = timed_run
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def previous_result(config: dict) -> dict | None:
+    if not os.path.exists(RESULTS_FILE):
+        return None
+    previous = None
+    with open(RESULTS_FILE) as f:
+        for line in f:
+            result = json.loads(line)
+            if result["config"] == config:
+                previous = result
+    return previous
+
+
+def print_report(result: dict, previous: dict | None) -> None:
+    print(f"{'phase':<28}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'prev p50':>11}")
+    for phase, stats in result["phases"].items():
+        before = previous["phases"].get(phase, {}).get("p50_ms") if previous else None
+        before = f"{before:>9.1f}ms" if before is not None else f"{'-':>11}"
+        print(
+            f"{phase:<28}{stats['count']:>7}{stats['p50_ms']:>8.1f}ms{stats['p95_ms']:>8.1f}ms"
+            f"{stats['p99_ms']:>8.1f}ms{stats['max_ms']:>8.1f}ms{before}"
+        )
+    print(f"Row growth: {json.dumps(result['row_growth'])}")
+    print(f"Account writes: {result['account_writes']}")
+    print(f"Processes spawned: {result['processes_spawned']}, peak memory: {result['peak_memory_mb']:.0f} MB")
+    print(f"Wall time: {result['wall_seconds']:.1f}s")
+
+
+async def main(args) -> None:
+    names = bench_names(args.traders)
+    models = {name: ScriptedModel(name, args.model_latency_ms / 1000, args.seed) for name in names}
+    traders.get_model = lambda name: models[name]
+    # The traders read their accounts through this client, so it uses the benchmark's transport too
+    accounts_client.accounts_client = accounts_client.AccountsClient(benchmark_server_params(args.transport)[0])
+    set_trace_processors([LogTracer()])
+    instrument()
+    for name in names:
+        Account.get(name).reset("Benchmark strategy: buy a few shares of a large company, then sell one.")
+    bench_traders = [traders.Trader(name, "Benchmark", name) for name in names]
+    before, version_before = count_rows(), account_version()
+    start = time.perf_counter()
+    with ResourceSampler() as sampler:
+        async with AsyncExitStack() as stack:
+            pool = None
+            if args.pool:
+                pool = MCPServerPool(benchmark_server_params(args.transport), [])
+                await stack.enter_async_context(pool)
+            for _ in range(args.cycles):
+                await asyncio.gather(*[run_cycle(trader, args.transport, pool) for trader in bench_traders])
+    after, version_after = count_rows(), account_version()
+    config = {"traders": args.traders, "cycles": args.cycles, "transport": args.transport, "pool": args.pool,
+              "model_latency_ms": args.model_latency_ms}
+    result = {
+        "datetime": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": git_commit(),
+        "config": config,
+        "wall_seconds": time.perf_counter() - start,
+        "phases": timings.summary(),
+        "row_growth": {table: after[table] - before[table] for table in after},
+        "account_writes": version_after - version_before,
+        "processes_spawned": len(sampler.children),
+        "peak_memory_mb": sampler.peak_rss / 1024 / 1024,
+    }
+    print_report(result, previous_result(config))
+    with open(RESULTS_FILE, "a") as f:
+        f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--traders", type=int, default=4, help="benchmark traders run concurrently in each cycle")
+    parser.add_argument("--cycles", type=int, default=3, help="trading cycles per trader")
+    parser.add_argument("--transport", choices=["stdio", "inprocess"], default="stdio", help="how to run our MCP servers")
+    parser.add_argument("--pool", action="store_true", help="keep the MCP servers running across cycles")
+    parser.add_argument("--model-latency-ms", type=float, default=0, help="simulated time the model takes per turn")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the scripted trades")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,66 @@
+"""
+Compare the latency of tool calls to our own MCP servers when run as stdio subprocesses
+versus mounted in-process.
+
+    uv run benchmark_transport.py --calls 200
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from mcp_pool import create_mcp_server
+
+BENCHMARK_ACCOUNT = "benchmark"
+
+SCENARIOS = [
+    ("accounts_server", "get_balance", {"name": BENCHMARK_ACCOUNT}),
+    ("accounts_server", "get_holdings", {"name": BENCHMARK_ACCOUNT}),
+    ("market_server", "lookup_share_price", {"symbol": "AAPL"}),
+]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def measure(params: dict, tool: str, arguments: dict, calls: int) -> dict[str, float]:
+    start = time.perf_counter()
+    async with create_mcp_server(params) as server:
+        startup = time.perf_counter() - start
+        await server.call_tool(tool, arguments)
+        latencies = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            await server.call_tool(tool, arguments)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "startup_ms": startup * 1000,
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+async def main(calls: int) -> None:
+    modes = {
+        "stdio": lambda module: {"command": "uv", "args": ["run", f"{module}.py"]},
+        "inprocess": lambda module: {"inprocess": module},
+    }
+    print(f"{'server':<16}{'tool':<20}{'mode':<11}{'startup':>10}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for module, tool, arguments in SCENARIOS:
+        for mode, make_params in modes.items():
+            result = await measure(make_params(module), tool, arguments, calls)
+            print(
+                f"{module:<16}{tool:<20}{mode:<11}{result['startup_ms']:>8.0f}ms"
+                f"{result['mean_ms']:>7.2f}ms{result['p50_ms']:>7.2f}ms{result['p95_ms']:>7.2f}ms{result['p99_ms']:>7.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=100, help="tool calls to time per scenario and mode")
+    args = parser.parse_args()
+    asyncio.run(main(args.calls))
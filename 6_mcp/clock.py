@@ -0,0 +1,24 @@
+from datetime import datetime
+
+# The time as far as trading is concerned. It is the wall clock, unless a backtest has set a
+# simulated time, in which case accounts, prompts and prices all see the simulated time instead.
+
+_simulated: datetime | None = None
+
+
+def now() -> datetime:
+    return _simulated or datetime.now()
+
+
+def today() -> str:
+    return now().strftime("%Y-%m-%d")
+
+
+def is_simulated() -> bool:
+    return _simulated is not None
+
+
+def set_time(moment: datetime | None) -> None:
+    """Fix the clock at this moment, or pass None to return to the wall clock"""
+    global _simulated
+    _simulated = moment
@@ -0,0 +1,174 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable
+from database import read_logs_since, read_log_tail, latest_log_id
+
+LOG_POLL_SECONDS = 0.5
+LOG_BACKLOG = 13
+SNAPSHOT_SECONDS = 120
+SNAPSHOT_CHECK_SECONDS = 5
+
+
+class LogSubscription:
+    """One dashboard session's view of the log feed: the traders it is watching, and a queue of their new entries"""
+
+    def __init__(self, names: set[str]):
+        self.loop = asyncio.get_running_loop()
+        self.names = names
+        self.updates = asyncio.Queue()
+
+
+class LogFeed:
+    """
+    A single tail of the logs table shared by every dashboard session in this process.
+    One background thread polls for rows newer than the last id it has seen and pushes each
+    subscription the new entries for the traders it is watching, as a list of (name, entry).
+    """
+
+    def __init__(self, poll_seconds: float = LOG_POLL_SECONDS, backlog: int = LOG_BACKLOG):
+        self.poll_seconds = poll_seconds
+        self.backlog_size = backlog
+        self.lock = threading.Lock()
+        self.recent: dict[str, deque] = defaultdict(lambda: deque(maxlen=self.backlog_size))
+        self.primed: set[str] = set()
+        self.subscriptions: set[LogSubscription] = set()
+        self.last_id = 0
+        self.thread = None
+
+    def start(self) -> None:
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.last_id = latest_log_id()
+            self.thread = threading.Thread(target=self._run, name="log-feed", daemon=True)
+            self.thread.start()
+
+    def _backlog(self, name: str) -> list:
+        if name not in self.primed:
+            # Every row up to last_id has already been polled, so the table's tail replaces what was collected
+            tail = [row for row in read_log_tail(name, self.backlog_size) if row[0] <= self.last_id]
+            self.recent[name] = deque(tail, maxlen=self.backlog_size)
+            self.primed.add(name)
+        return [(name, entry) for entry in self.recent[name]]
+
+    def subscribe(self, names: list[str]) -> tuple[list, LogSubscription]:
+        """Return the recent entries for these traders, and a subscription that receives their new entries"""
+        self.start()
+        names = {name.lower() for name in names}
+        subscription = LogSubscription(names)
+        with self.lock:
+            self.subscriptions.add(subscription)
+            return [item for name in sorted(names) for item in self._backlog(name)], subscription
+
+    def watch(self, subscription: LogSubscription, names: list[str]) -> list:
+        """Switch a subscription to a different set of traders, returning their recent entries"""
+        names = {name.lower() for name in names}
+        with self.lock:
+            subscription.names = names
+            return [item for name in sorted(names) for item in self._backlog(name)]
+
+    def unsubscribe(self, subscription: LogSubscription) -> None:
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def poll(self) -> int:
+        rows = read_logs_since(self.last_id)
+        if not rows:
+            return 0
+        with self.lock:
+            for id, name, dt, type, message in rows:
+                self.recent[name].append((id, dt, type, message))
+            self.last_id = rows[-1][0]
+            deliveries = []
+            for subscription in self.subscriptions:
+                entries = [(name, (id, dt, type, message)) for id, name, dt, type, message in rows if name in subscription.names]
+                if entries:
+                    deliveries.append((subscription, entries))
+        for subscription, entries in deliveries:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.updates.put_nowait, entries)
+            except RuntimeError:
+                pass  # The session's event loop has closed
+        return len(rows)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Log feed failed to poll: {e}")
+            time.sleep(self.poll_seconds)
+
+
+log_feed = LogFeed()
+
+
+class SnapshotCache:
+    """
+    Server-side cache of dashboard snapshots (one per trader, plus any other keyed view), shared by every session.
+    A background thread rebuilds a snapshot once per interval, or sooner when its signature
+    (an account version) changes; sessions only ever read the latest build.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[str], Any],
+        signature: Callable[[str], Any],
+        interval: float = SNAPSHOT_SECONDS,
+        check_seconds: float = SNAPSHOT_CHECK_SECONDS,
+    ):
+        self.build = build
+        self.signature = signature
+        self.interval = interval
+        self.check_seconds = check_seconds
+        self.lock = threading.Lock()
+        self.build_locks: dict[str, threading.RLock] = defaultdict(threading.RLock)
+        self.snapshots: dict[str, tuple[int, Any]] = {}
+        self.signatures: dict[str, Any] = {}
+        self.built_at: dict[str, float] = {}
+        self.generation = 0
+        self.thread = None
+
+    def start(self) -> None:
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name="snapshot-cache", daemon=True)
+            self.thread.start()
+
+    def get(self, name: str) -> tuple[int, Any]:
+        """Return (generation, snapshot) for this trader; the generation changes whenever the snapshot is rebuilt"""
+        self.start()
+        snapshot = self.snapshots.get(name)
+        if snapshot is None:
+            with self.build_locks[name]:
+                snapshot = self.snapshots.get(name) or self.refresh(name)
+        return snapshot
+
+    def refresh(self, name: str) -> tuple[int, Any]:
+        with self.build_locks[name]:
+            signature = self.signature(name)
+            value = self.build(name)
+            with self.lock:
+                self.generation += 1
+                self.snapshots[name] = (self.generation, value)
+                self.signatures[name] = signature
+                self.built_at[name] = time.monotonic()
+                return self.snapshots[name]
+
+    def is_stale(self, name: str) -> bool:
+        if time.monotonic() - self.built_at.get(name, 0) >= self.interval:
+            return True
+        return self.signature(name) != self.signatures.get(name)
+
+    def _run(self) -> None:
+        while True:
+            for name in list(self.snapshots):
+                try:
+                    if self.is_stale(name):
+                        self.refresh(name)
+                except Exception as e:
+                    print(f"Snapshot cache failed to refresh {name}: {e}")
+            time.sleep(self.check_seconds)
@@ -1,17 +1,121 @@
 import sqlite3
 import json
-from datetime import datetime
+import os
+import queue
+import threading
+import atexit
+import signal
+import gzip
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
 DB = "accounts.db"
 
+# Connections are pooled per thread, and re-created after a fork, so every caller in a process
+# (MCP server tools, the LogTracer, the Gradio timers) reuses a warm connection with its cache of
+# prepared statements instead of paying connect + pragma setup on each call.
 
-with sqlite3.connect(DB) as conn:
-    cursor = conn.cursor()
-    cursor.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)')
-    cursor.execute('''
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=CACHED_STATEMENTS,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """Return this thread's pooled connection, opening it on first use in this process"""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        conn = _connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def close_connection() -> None:
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, definition: str) -> bool:
+    """Add the column if the table doesn't have it yet; returns True if it was added"""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+    return False
+
+
+# Accounts are stored normalized: one row per account in accounts, plus holdings, transactions and
+# portfolio_snapshots keyed by account name. Trades and valuations are appended rather than
+# rewriting the whole account. The legacy account column holds the JSON blob that older versions
+# wrote, until migrate_json_accounts imports it. Every write to an account sets its version to one
+# more than the highest version of any account, so readers can cheaply tell what has changed.
+
+with get_connection() as conn:
+    conn.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, balance REAL, strategy TEXT, account TEXT)')
+    _add_column(conn, "accounts", "balance", "REAL")
+    _add_column(conn, "accounts", "strategy", "TEXT")
+    _add_column(conn, "accounts", "version", "INTEGER NOT NULL DEFAULT 0")
+    # Running totals kept up to date by each trade, so P&L never needs the whole transaction history:
+    # net_invested is the sum of every transaction's quantity * price, realized_pnl the profit locked in
+    # by sales against the average cost of the holding sold
+    aggregates_added = _add_column(conn, "accounts", "net_invested", "REAL NOT NULL DEFAULT 0")
+    _add_column(conn, "accounts", "realized_pnl", "REAL NOT NULL DEFAULT 0")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_accounts_version ON accounts (version)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS holdings (
+            name TEXT,
+            symbol TEXT,
+            quantity INTEGER,
+            PRIMARY KEY (name, symbol)
+        )
+    ''')
+    _add_column(conn, "holdings", "avg_cost", "REAL NOT NULL DEFAULT 0")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            symbol TEXT,
+            quantity INTEGER,
+            price REAL,
+            timestamp TEXT,
+            rationale TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_name ON transactions (name, id)')
+    # A trade request may carry an idempotency key, so that a retried request is only applied once
+    _add_column(conn, "transactions", "idempotency_key", "TEXT")
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_idempotency_key
+        ON transactions (name, idempotency_key) WHERE idempotency_key IS NOT NULL
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            datetime TEXT,
+            value REAL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_snapshots_name ON portfolio_snapshots (name, id)')
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT,
@@ -20,82 +124,678 @@ with sqlite3.connect(DB) as conn:
             message TEXT
         )
     ''')
-    cursor.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
-    conn.commit()
+    # Log ids increase with insertion time, so (name, id) serves both the latest-N and the keyset reads
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_name_id ON logs (name, id)')
+    conn.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
+    # Price history, one row per (date, symbol); date is the day the price is quoted for, i.e. the
+    # latest close as of that day. The legacy market table held one JSON blob per date.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prices (
+            date TEXT,
+            symbol TEXT,
+            close REAL,
+            PRIMARY KEY (date, symbol)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_prices_symbol_date ON prices (symbol, date)')
+    # The registry of traders on the floor, in the order they were registered
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS traders (
+            name TEXT PRIMARY KEY COLLATE NOCASE,
+            lastname TEXT,
+            model_name TEXT,
+            short_model_name TEXT,
+            run_every_n_minutes REAL,
+            active INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    # Token usage of each trading run, to see how much of the input the provider served from its prompt cache
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            datetime DATETIME,
+            run TEXT,
+            requests INTEGER,
+            input_tokens INTEGER,
+            cached_input_tokens INTEGER,
+            output_tokens INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_usage_name_id ON usage (name, id)')
+    # Backtests: one row per simulated run of a trader over a date range, and its equity curve
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS backtest_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account TEXT,
+            trader TEXT,
+            model_name TEXT,
+            strategy TEXT,
+            start TEXT,
+            end TEXT,
+            status TEXT,
+            started_at DATETIME,
+            finished_at DATETIME,
+            final_value REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS backtest_equity (
+            run_id INTEGER,
+            date TEXT,
+            value REAL,
+            PRIMARY KEY (run_id, date)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _bump_version(conn: sqlite3.Connection, name: str) -> None:
+    conn.execute('UPDATE accounts SET version = (SELECT COALESCE(MAX(version), 0) + 1 FROM accounts) WHERE name = ?', (name,))
+
+
+def _insert_transaction(conn: sqlite3.Connection, name: str, transaction: dict, idempotency_key: str | None = None) -> None:
+    conn.execute('''
+        INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale, idempotency_key)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (name, transaction["symbol"], transaction["quantity"], transaction["price"],
+          transaction["timestamp"], transaction["rationale"], idempotency_key))
+
+
+def _aggregates(transactions: list[dict]) -> tuple[float, float, dict[str, float]]:
+    """Replay transactions into (net_invested, realized_pnl, average cost per share of each holding)"""
+    net_invested, realized_pnl = 0.0, 0.0
+    quantities: dict[str, int] = {}
+    average_costs: dict[str, float] = {}
+    for transaction in transactions:
+        symbol, quantity, price = transaction["symbol"], transaction["quantity"], transaction["price"]
+        held = quantities.get(symbol, 0)
+        net_invested += quantity * price
+        if quantity > 0:
+            average_costs[symbol] = (held * average_costs.get(symbol, 0.0) + quantity * price) / (held + quantity)
+        else:
+            realized_pnl += (price - average_costs.get(symbol, price)) * -quantity
+        quantities[symbol] = held + quantity
+    return net_invested, realized_pnl, average_costs
+
+
+def _write_aggregates(conn: sqlite3.Connection, name: str, transactions: list[dict]) -> None:
+    net_invested, realized_pnl, average_costs = _aggregates(transactions)
+    conn.execute('UPDATE accounts SET net_invested = ?, realized_pnl = ? WHERE name = ?', (net_invested, realized_pnl, name))
+    conn.executemany('UPDATE holdings SET avg_cost = ? WHERE name = ? AND symbol = ?',
+                     [(average_cost, name, symbol) for symbol, average_cost in average_costs.items()])
+
+
+def _replace_account(conn: sqlite3.Connection, name: str, account_dict: dict) -> None:
+    conn.execute('''
+        INSERT INTO accounts (name, balance, strategy, account)
+        VALUES (?, ?, ?, NULL)
+        ON CONFLICT(name) DO UPDATE SET balance=excluded.balance, strategy=excluded.strategy, account=NULL
+    ''', (name, account_dict["balance"], account_dict["strategy"]))
+    conn.execute('DELETE FROM holdings WHERE name = ?', (name,))
+    conn.executemany('INSERT INTO holdings (name, symbol, quantity) VALUES (?, ?, ?)',
+                     [(name, symbol, quantity) for symbol, quantity in account_dict["holdings"].items()])
+    conn.execute('DELETE FROM transactions WHERE name = ?', (name,))
+    for transaction in account_dict["transactions"]:
+        _insert_transaction(conn, name, transaction)
+    conn.execute('DELETE FROM portfolio_snapshots WHERE name = ?', (name,))
+    conn.executemany('INSERT INTO portfolio_snapshots (name, datetime, value) VALUES (?, ?, ?)',
+                     [(name, dt, value) for dt, value in account_dict["portfolio_value_time_series"]])
+    _write_aggregates(conn, name, account_dict["transactions"])
+    _bump_version(conn, name)
+
+
+def create_account(name: str, balance: float, strategy: str = "") -> None:
+    """Create an empty account unless it already exists; an existing account is left untouched"""
+    name = name.lower()
+    with get_connection() as conn:
+        created = conn.execute('''
+            INSERT INTO accounts (name, balance, strategy, account) VALUES (?, ?, ?, NULL)
+            ON CONFLICT(name) DO NOTHING
+        ''', (name, balance, strategy)).rowcount
+        if created:
+            _bump_version(conn, name)
+
 
 def write_account(name, account_dict):
-    json_data = json.dumps(account_dict)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO accounts (name, account)
-            VALUES (?, ?)
-            ON CONFLICT(name) DO UPDATE SET account=excluded.account
-        ''', (name.lower(), json_data))
-        conn.commit()
+    """Replace the whole account; used when resetting an account"""
+    with get_connection() as conn:
+        _replace_account(conn, name.lower(), account_dict)
+
+_account_cache: dict[str, tuple[int, dict]] = {}
 
 def read_account(name):
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT account FROM accounts WHERE name = ?', (name.lower(),))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
-    
+    """Return the account as a dict; unchanged accounts are served from a per-process cache, so treat it as read-only"""
+    name = name.lower()
+    conn = get_connection()
+    # One read transaction, so the account row, holdings, transactions and snapshots are all from the same commit
+    with conn:
+        conn.execute("BEGIN")
+        row = conn.execute('''
+            SELECT balance, strategy, version, net_invested, realized_pnl FROM accounts
+            WHERE name = ? AND account IS NULL
+        ''', (name,)).fetchone()
+        if not row:
+            return None
+        cached = _account_cache.get(name)
+        if cached and cached[0] == row[2]:
+            return cached[1]
+        holdings = conn.execute('SELECT symbol, quantity, avg_cost FROM holdings WHERE name = ? ORDER BY rowid', (name,)).fetchall()
+        transactions = conn.execute('''
+            SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+            WHERE name = ? ORDER BY id
+        ''', (name,)).fetchall()
+        snapshots = conn.execute('SELECT datetime, value FROM portfolio_snapshots WHERE name = ? ORDER BY id', (name,)).fetchall()
+    account = {
+        "name": name,
+        "balance": row[0],
+        "strategy": row[1],
+        "holdings": {symbol: quantity for symbol, quantity, _ in holdings},
+        "average_costs": {symbol: avg_cost for symbol, _, avg_cost in holdings},
+        "net_invested": row[3],
+        "realized_profit_loss": row[4],
+        "transactions": [
+            {"symbol": symbol, "quantity": quantity, "price": price, "timestamp": timestamp, "rationale": rationale}
+            for symbol, quantity, price, timestamp, rationale in transactions
+        ],
+        "portfolio_value_time_series": [list(snapshot) for snapshot in snapshots],
+    }
+    _account_cache[name] = (row[2], account)
+    return account
+
+def account_version(name: str) -> int | None:
+    """The current version of the account, or None if there is no such account"""
+    row = get_connection().execute('SELECT version FROM accounts WHERE name = ?', (name.lower(),)).fetchone()
+    return row[0] if row else None
+
+def changed_since(version: int) -> dict[str, int]:
+    """Map of account name to version for every account written after the given version"""
+    rows = get_connection().execute('SELECT name, version FROM accounts WHERE version > ? ORDER BY version', (version,)).fetchall()
+    return dict(rows)
+
+def latest_account_version() -> int:
+    row = get_connection().execute('SELECT MAX(version) FROM accounts').fetchone()
+    return row[0] or 0
+
+def write_strategy(name: str, strategy: str) -> None:
+    with get_connection() as conn:
+        conn.execute('UPDATE accounts SET strategy = ? WHERE name = ?', (strategy, name.lower()))
+        _bump_version(conn, name.lower())
+
+def adjust_balance(name: str, amount: float) -> float:
+    """Add amount (negative to withdraw) to the balance in one transaction, refusing to go negative; returns the new balance"""
+    name = name.lower()
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute('SELECT balance FROM accounts WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise ValueError(f"No account for {name}")
+        if row[0] + amount < 0:
+            raise ValueError("Insufficient funds for withdrawal.")
+        conn.execute('UPDATE accounts SET balance = ? WHERE name = ?', (row[0] + amount, name))
+        _bump_version(conn, name)
+    return row[0] + amount
+
+def execute_trade(name: str, transaction: dict, idempotency_key: str | None = None) -> bool:
+    """
+    Apply a trade to the account in one transaction: check the balance or holding as it is now,
+    then update the balance and holding and append the transaction.
+    BEGIN IMMEDIATE takes the write lock before reading, so concurrent trades on the account,
+    from any thread or process, are applied one after the other and never lost.
+    Returns False, changing nothing, if this trade was already applied with this idempotency key;
+    raises ValueError if the key was used for a trade of another symbol or quantity.
+    """
+    name = name.lower()
+    symbol, quantity = transaction["symbol"], transaction["quantity"]
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if idempotency_key is not None:
+            previous = conn.execute('SELECT symbol, quantity FROM transactions WHERE name = ? AND idempotency_key = ?',
+                                    (name, idempotency_key)).fetchone()
+            if previous:
+                if previous != (symbol, quantity):
+                    raise ValueError(f"Idempotency key {idempotency_key} was already used for a different trade.")
+                return False
+        row = conn.execute('SELECT balance FROM accounts WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise ValueError(f"No account for {name}")
+        holding = conn.execute('SELECT quantity, avg_cost FROM holdings WHERE name = ? AND symbol = ?', (name, symbol)).fetchone()
+        held, average_cost = holding if holding else (0, 0.0)
+        price = transaction["price"]
+        cost = quantity * price
+        if quantity > 0 and cost > row[0]:
+            raise ValueError("Insufficient funds to buy shares.")
+        if quantity < 0 and held < -quantity:
+            raise ValueError(f"Cannot sell {-quantity} shares of {symbol}. Not enough shares held.")
+        if quantity > 0:
+            realized = 0.0
+            average_cost = (held * average_cost + cost) / (held + quantity)
+        else:
+            realized = (price - average_cost) * -quantity
+        conn.execute('''
+            UPDATE accounts SET balance = ?, net_invested = net_invested + ?, realized_pnl = realized_pnl + ?
+            WHERE name = ?
+        ''', (row[0] - cost, cost, realized, name))
+        if held + quantity:
+            conn.execute('''
+                INSERT INTO holdings (name, symbol, quantity, avg_cost)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(name, symbol) DO UPDATE SET quantity=excluded.quantity, avg_cost=excluded.avg_cost
+            ''', (name, symbol, held + quantity, average_cost))
+        else:
+            conn.execute('DELETE FROM holdings WHERE name = ? AND symbol = ?', (name, symbol))
+        _insert_transaction(conn, name, transaction, idempotency_key)
+        _bump_version(conn, name)
+    return True
+
+def write_portfolio_value(name: str, datetime: str, value: float) -> None:
+    with get_connection() as conn:
+        conn.execute('INSERT INTO portfolio_snapshots (name, datetime, value) VALUES (?, ?, ?)',
+                     (name.lower(), datetime, value))
+        _bump_version(conn, name.lower())
+
+def migrate_json_accounts() -> int:
+    """Import accounts still stored as a JSON blob into the normalized tables; returns the number migrated"""
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute('SELECT name, account FROM accounts WHERE account IS NOT NULL').fetchall()
+        for name, account_json in rows:
+            _replace_account(conn, name, json.loads(account_json))
+    return len(rows)
+
+
+def rebuild_aggregates() -> int:
+    """Recompute every account's running totals from its transactions; returns the number of accounts"""
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        names = [row[0] for row in conn.execute('SELECT name FROM accounts WHERE account IS NULL').fetchall()]
+        for name in names:
+            transactions = conn.execute(
+                'SELECT symbol, quantity, price FROM transactions WHERE name = ? ORDER BY id', (name,)
+            ).fetchall()
+            _write_aggregates(conn, name, [dict(zip(("symbol", "quantity", "price"), row)) for row in transactions])
+    return len(names)
+
+
+migrate_json_accounts()
+if aggregates_added:
+    rebuild_aggregates()
+
+
+# Log rows are buffered in memory and written in bulk by a background thread, so tracing a span
+# never blocks the agent's event loop on an INSERT and a commit.
+
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "0.5"))
+
+
+class LogWriter:
+    def __init__(self, batch_size: int = LOG_BATCH_SIZE, flush_seconds: float = LOG_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue = queue.SimpleQueue()
+        # Rows from a batch that failed to write, kept to go first in the next attempt
+        self.failed: list[tuple] = []
+        self.wakeup = threading.Event()
+        self.flush_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+
+    def write(self, name: str, type: str, message: str) -> None:
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        self.queue.put((name.lower(), now, type, message))
+        self._ensure_started()
+        if self.queue.qsize() >= self.batch_size:
+            self.wakeup.set()
+
+    def _ensure_started(self) -> None:
+        if self.thread is not None and self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.thread is None or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.wakeup.wait(self.flush_seconds)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Log writer failed to flush: {e}")
+
+    def pending(self) -> int:
+        return self.queue.qsize() + len(self.failed)
+
+    def flush(self) -> int:
+        """
+        Write every buffered log row in a single transaction; returns the number written.
+        If the write fails, the rows are kept for the next flush and the error is raised.
+        """
+        with self.flush_lock:
+            rows, self.failed = self.failed, []
+            while True:
+                try:
+                    rows.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if rows:
+                try:
+                    with get_connection() as conn:
+                        conn.executemany('''
+                            INSERT INTO logs (name, datetime, type, message)
+                            VALUES (?, ?, ?, ?)
+                        ''', rows)
+                except sqlite3.Error:
+                    self.failed = rows
+                    raise
+            return len(rows)
+
+
+log_writer = LogWriter()
+
+
+def flush_logs() -> int:
+    return log_writer.flush()
+
+
+def _flush_before_read() -> None:
+    """Write out buffered rows so a reader sees them; if that fails, the writer thread retries, so read what is there"""
+    if log_writer.pending():
+        try:
+            flush_logs()
+        except sqlite3.Error:
+            pass
+
+
+atexit.register(flush_logs)
+
+
+def flush_logs_on_terminate() -> None:
+    """
+    Also flush buffered logs when this process is terminated. MCP clients stop stdio servers with
+    SIGTERM, which kills Python without running atexit handlers. Call from the main thread.
+    """
+    def terminate(signum, frame):
+        try:
+            flush_logs()
+        finally:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+    signal.signal(signal.SIGTERM, terminate)
+
+
 def write_log(name: str, type: str, message: str):
     """
-    Write a log entry to the logs table.
-    
+    Queue a log entry for the logs table; it is written with the next batch.
+
     Args:
         name (str): The name associated with the log
         type (str): The type of log entry
         message (str): The log message
     """
-    now = datetime.now().isoformat()
-    
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO logs (name, datetime, type, message)
-            VALUES (?, datetime('now'), ?, ?)
-        ''', (name.lower(), type, message))
-        conn.commit()
+    log_writer.write(name, type, message)
 
 def read_log(name: str, last_n=10):
     """
     Read the most recent log entries for a given name.
-    
+
     Args:
         name (str): The name to retrieve logs for
         last_n (int): Number of most recent entries to retrieve
-        
+
     Returns:
         list: A list of tuples containing (datetime, type, message)
     """
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT datetime, type, message FROM logs 
-            WHERE name = ? 
-            ORDER BY datetime DESC
-            LIMIT ?
-        ''', (name.lower(), last_n))
-        
-        return reversed(cursor.fetchall())
+    _flush_before_read()
+    cursor = get_connection().execute('''
+        SELECT datetime, type, message FROM logs
+        WHERE name = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), last_n))
+    return reversed(cursor.fetchall())
+
+def read_log_since(name: str, last_id: int = 0, limit: int = 100):
+    """
+    Read the log entries for a given name written after the entry with id last_id.
+
+    Args:
+        name (str): The name to retrieve logs for
+        last_id (int): The id of the last entry already seen; 0 to start from the beginning
+        limit (int): Maximum number of entries to retrieve
+
+    Returns:
+        list: A list of tuples containing (id, datetime, type, message), oldest first
+    """
+    _flush_before_read()
+    cursor = get_connection().execute('''
+        SELECT id, datetime, type, message FROM logs
+        WHERE name = ? AND id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', (name.lower(), last_id, limit))
+    return cursor.fetchall()
+
+def read_logs_since(last_id: int, limit: int = 1000):
+    """
+    Read log entries for every name written after the entry with id last_id.
+
+    Returns:
+        list: A list of tuples containing (id, name, datetime, type, message), oldest first
+    """
+    _flush_before_read()
+    cursor = get_connection().execute('''
+        SELECT id, name, datetime, type, message FROM logs
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', (last_id, limit))
+    return cursor.fetchall()
+
+def read_log_tail(name: str, last_n=10):
+    """Like read_log, but returns (id, datetime, type, message) so the caller can continue with read_log_since"""
+    _flush_before_read()
+    cursor = get_connection().execute('''
+        SELECT id, datetime, type, message FROM logs
+        WHERE name = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), last_n))
+    return list(reversed(cursor.fetchall()))
+
+def latest_log_id() -> int:
+    _flush_before_read()
+    row = get_connection().execute('SELECT MAX(id) FROM logs').fetchone()
+    return row[0] or 0
+
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "30"))
+LOG_ARCHIVE_DIR = "logs_archive"
+LOG_ARCHIVE_CHUNK = 10_000
+
+def archive_logs(older_than_days: int = LOG_RETENTION_DAYS, directory: str = LOG_ARCHIVE_DIR) -> int:
+    """
+    Move log entries older than the retention period into a gzipped JSON-lines file in directory,
+    then delete them from the logs table. Returns the number of entries archived.
+    """
+    flush_logs()
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_connection()
+    oldest = conn.execute('SELECT datetime FROM logs ORDER BY id LIMIT 1').fetchone()
+    if not oldest or oldest[0] >= cutoff:
+        return 0
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"logs-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}.jsonl.gz")
+    archived = 0
+    last_id = 0
+    with gzip.open(path, "at", encoding="utf-8") as archive:
+        while True:
+            rows = conn.execute('''
+                SELECT id, name, datetime, type, message FROM logs
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (last_id, LOG_ARCHIVE_CHUNK)).fetchall()
+            expired = [row for row in rows if row[2] < cutoff]
+            if expired:
+                for id, name, dt, type, message in expired:
+                    archive.write(json.dumps({"id": id, "name": name, "datetime": dt, "type": type, "message": message}) + "\n")
+                archive.flush()
+                last_id = expired[-1][0]
+                with conn:
+                    conn.execute('DELETE FROM logs WHERE id <= ? AND datetime < ?', (last_id, cutoff))
+                archived += len(expired)
+            if len(expired) < LOG_ARCHIVE_CHUNK:
+                break
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return archived
+
+def write_trader(name: str, lastname: str, model_name: str, short_model_name: str,
+                 run_every_n_minutes: float | None = None, active: bool = True) -> None:
+    with get_connection() as conn:
+        conn.execute('''
+            INSERT INTO traders (name, lastname, model_name, short_model_name, run_every_n_minutes, active)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET lastname=excluded.lastname, model_name=excluded.model_name,
+                short_model_name=excluded.short_model_name, run_every_n_minutes=excluded.run_every_n_minutes,
+                active=excluded.active
+        ''', (name, lastname, model_name, short_model_name, run_every_n_minutes, int(active)))
+
+def read_traders(active_only: bool = True) -> list[dict]:
+    """The registered traders, in the order they were registered"""
+    cursor = get_connection().execute(f'''
+        SELECT name, lastname, model_name, short_model_name, run_every_n_minutes, active FROM traders
+        {"WHERE active = 1" if active_only else ""}
+        ORDER BY rowid
+    ''')
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def write_usage(name: str, run: str, requests: int, input_tokens: int, cached_input_tokens: int, output_tokens: int) -> None:
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    with get_connection() as conn:
+        conn.execute('''
+            INSERT INTO usage (name, datetime, run, requests, input_tokens, cached_input_tokens, output_tokens)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (name.lower(), now, run, requests, input_tokens, cached_input_tokens, output_tokens))
+
+def read_usage(name: str, last_n=20) -> list[dict]:
+    """The token usage of this trader's most recent runs, oldest first"""
+    cursor = get_connection().execute('''
+        SELECT datetime, run, requests, input_tokens, cached_input_tokens, output_tokens FROM usage
+        WHERE name = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), last_n))
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in reversed(cursor.fetchall())]
+
+def create_backtest_run(trader: str, model_name: str, strategy: str, start: str, end: str) -> int:
+    """Start a backtest run; its account is named after the trader and the run id, so it never touches the live account"""
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    with get_connection() as conn:
+        cursor = conn.execute('''
+            INSERT INTO backtest_runs (trader, model_name, strategy, start, end, status, started_at)
+            VALUES (?, ?, ?, ?, ?, 'running', ?)
+        ''', (trader, model_name, strategy, start, end, now))
+        run_id = cursor.lastrowid
+        conn.execute('UPDATE backtest_runs SET account = ? WHERE id = ?', (f"{trader.lower()}-bt{run_id}", run_id))
+    return run_id
+
+def read_backtest_run(run_id: int) -> dict | None:
+    cursor = get_connection().execute('SELECT * FROM backtest_runs WHERE id = ?', (run_id,))
+    row = cursor.fetchone()
+    return dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+def write_backtest_equity(run_id: int, date: str, value: float) -> None:
+    with get_connection() as conn:
+        conn.execute('''
+            INSERT INTO backtest_equity (run_id, date, value) VALUES (?, ?, ?)
+            ON CONFLICT(run_id, date) DO UPDATE SET value=excluded.value
+        ''', (run_id, date, value))
+
+def finish_backtest_run(run_id: int, status: str, final_value: float | None) -> None:
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    with get_connection() as conn:
+        conn.execute('UPDATE backtest_runs SET status = ?, finished_at = ?, final_value = ? WHERE id = ?',
+                     (status, now, final_value, run_id))
+
+def read_backtest_equity(run_id: int) -> list[tuple[str, float]]:
+    """(date, value) of the run's portfolio at the end of each simulated day, oldest first"""
+    return get_connection().execute(
+        'SELECT date, value FROM backtest_equity WHERE run_id = ? ORDER BY date', (run_id,)
+    ).fetchall()
+
+MAX_SQL_VARIABLES = 500
+
+def write_prices(date: str, prices: dict[str, float]) -> None:
+    with get_connection() as conn:
+        conn.executemany('''
+            INSERT INTO prices (date, symbol, close)
+            VALUES (?, ?, ?)
+            ON CONFLICT(date, symbol) DO UPDATE SET close=excluded.close
+        ''', [(date, symbol, close) for symbol, close in prices.items()])
+
+def has_prices(date: str) -> bool:
+    return get_connection().execute('SELECT 1 FROM prices WHERE date = ? LIMIT 1', (date,)).fetchone() is not None
+
+def read_price(date: str, symbol: str) -> float | None:
+    row = get_connection().execute('SELECT close FROM prices WHERE date = ? AND symbol = ?', (date, symbol)).fetchone()
+    return row[0] if row else None
+
+def read_prices(date: str, symbols: list[str]) -> dict[str, float]:
+    """Prices of the given symbols on the date; symbols with no price are left out"""
+    symbols = list(dict.fromkeys(symbols))
+    result = {}
+    conn = get_connection()
+    for i in range(0, len(symbols), MAX_SQL_VARIABLES):
+        chunk = symbols[i:i + MAX_SQL_VARIABLES]
+        placeholders = ", ".join("?" * len(chunk))
+        rows = conn.execute(
+            f'SELECT symbol, close FROM prices WHERE date = ? AND symbol IN ({placeholders})', (date, *chunk)
+        ).fetchall()
+        result.update(rows)
+    return result
+
+def read_price_history(symbol: str, start: str, end: str) -> list[tuple[str, float]]:
+    """(date, close) for the symbol on every stored date from start to end inclusive, oldest first"""
+    return get_connection().execute('''
+        SELECT date, close FROM prices
+        WHERE symbol = ? AND date BETWEEN ? AND ?
+        ORDER BY date
+    ''', (symbol, start, end)).fetchall()
+
+def read_price_dates(start: str, end: str) -> list[str]:
+    rows = get_connection().execute('''
+        SELECT DISTINCT date FROM prices WHERE date BETWEEN ? AND ? ORDER BY date
+    ''', (start, end)).fetchall()
+    return [row[0] for row in rows]
 
 def write_market(date: str, data: dict) -> None:
-    data_json = json.dumps(data)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO market (date, data)
-            VALUES (?, ?)
-            ON CONFLICT(date) DO UPDATE SET data=excluded.data
-        ''', (date, data_json))
-        conn.commit()
+    write_prices(date, data)
 
 def read_market(date: str) -> dict | None:
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT data FROM market WHERE date = ?', (date,))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
\ No newline at end of file
+    rows = get_connection().execute('SELECT symbol, close FROM prices WHERE date = ?', (date,)).fetchall()
+    return dict(rows) if rows else None
+
+def migrate_market_blobs() -> int:
+    """Move the legacy one-blob-per-date market rows into the prices table; returns the number of dates migrated"""
+    conn = get_connection()
+    dates = [row[0] for row in conn.execute('SELECT date FROM market')]
+    for date in dates:
+        row = conn.execute('SELECT data FROM market WHERE date = ?', (date,)).fetchone()
+        if row:
+            write_prices(date, json.loads(row[0]))
+        with conn:
+            conn.execute('DELETE FROM market WHERE date = ?', (date,))
+    return len(dates)
+
+
+migrate_market_blobs()
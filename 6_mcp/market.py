@@ -1,10 +1,15 @@
 from polygon import RESTClient
 from dotenv import load_dotenv
 import os
-from datetime import datetime
-import random
-from database import write_market, read_market
+from datetime import datetime, date, timedelta
+import threading
+import time
+from concurrent.futures import Future
 from functools import lru_cache
+import clock
+from market_simulator import market_simulator
+from market_calendar import get_calendar
+from database import write_prices, has_prices, read_price, read_prices
 from datetime import timezone
 
 load_dotenv(override=True)
@@ -15,45 +20,224 @@ polygon_plan = os.getenv("POLYGON_PLAN")
 is_paid_polygon = polygon_plan == "paid"
 is_realtime_polygon = polygon_plan == "realtime"
 
+# Intraday quotes are cached per symbol; the default matches how often the plan's data can change
+PRICE_CACHE_SECONDS = float(os.getenv("PRICE_CACHE_SECONDS", "5" if is_realtime_polygon else "60"))
+MARKET_STATUS_CACHE_SECONDS = float(os.getenv("MARKET_STATUS_CACHE_SECONDS", "60"))
+
+
+@lru_cache(maxsize=1)
+def get_client() -> RESTClient:
+    """One Polygon client per process, so its HTTP connection pool is reused across calls"""
+    return RESTClient(polygon_api_key)
+
+
+class PriceCache:
+    """
+    A per-symbol TTL cache in front of a price source. Concurrent lookups of a symbol that is
+    already being fetched wait for that fetch instead of making their own request.
+    """
+
+    def __init__(self, fetch_one, fetch_many, ttl: float = PRICE_CACHE_SECONDS):
+        self.fetch_one = fetch_one
+        self.fetch_many = fetch_many
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.prices: dict[str, tuple[float, float]] = {}
+        self.inflight: dict[str, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _claim(self, symbols: list[str]) -> tuple[dict[str, float], dict[str, Future], dict[str, Future]]:
+        """Split symbols into cached prices, fetches this caller must make, and fetches already in flight"""
+        now = time.monotonic()
+        cached, owned, waiting = {}, {}, {}
+        with self.lock:
+            for symbol in symbols:
+                entry = self.prices.get(symbol)
+                if entry and entry[0] > now:
+                    self.hits += 1
+                    cached[symbol] = entry[1]
+                elif symbol in self.inflight:
+                    self.coalesced += 1
+                    waiting[symbol] = self.inflight[symbol]
+                else:
+                    self.misses += 1
+                    owned[symbol] = self.inflight[symbol] = Future()
+        return cached, owned, waiting
+
+    def _settle(self, owned: dict[str, Future], prices: dict[str, float] | None, error: Exception | None) -> None:
+        expires = time.monotonic() + self.ttl
+        with self.lock:
+            for symbol, future in owned.items():
+                self.inflight.pop(symbol, None)
+                if error is None:
+                    self.prices[symbol] = (expires, prices[symbol])
+        for symbol, future in owned.items():
+            if error is None:
+                future.set_result(prices[symbol])
+            else:
+                future.set_exception(error)
+
+    def get(self, symbol: str) -> float:
+        return self.get_many([symbol])[symbol]
+
+    def get_many(self, symbols: list[str]) -> dict[str, float]:
+        symbols = list(dict.fromkeys(symbols))
+        cached, owned, waiting = self._claim(symbols)
+        if owned:
+            try:
+                if len(owned) == 1:
+                    symbol = next(iter(owned))
+                    prices = {symbol: self.fetch_one(symbol)}
+                else:
+                    prices = self.fetch_many(list(owned))
+            except Exception as e:
+                self._settle(owned, None, e)
+                raise
+            self._settle(owned, prices, None)
+            cached.update(prices)
+        for symbol, future in waiting.items():
+            cached[symbol] = future.result()
+        return {symbol: cached[symbol] for symbol in symbols}
+
+    def stats(self) -> dict[str, float]:
+        with self.lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+                "symbols": len(self.prices),
+                "ttl": self.ttl,
+            }
+
+
+_market_status = {"open": None, "expires": 0.0}
+_market_status_lock = threading.Lock()
+
 
 def is_market_open() -> bool:
-    client = RESTClient(polygon_api_key)
-    market_status = client.get_market_status()
-    return market_status.market == "open"
+    """
+    Polygon's market status, cached for MARKET_STATUS_CACHE_SECONDS.
+    Without an API key, or when Polygon can't be reached, the local market calendar decides.
+    """
+    with _market_status_lock:
+        if time.monotonic() < _market_status["expires"]:
+            return _market_status["open"]
+        try:
+            if not polygon_api_key:
+                raise ValueError("No Polygon API key")
+            is_open = get_client().get_market_status().market == "open"
+        except Exception as e:
+            is_open = get_calendar().is_open()
+            if polygon_api_key:
+                print(f"Could not get market status from Polygon ({e}); using the market calendar")
+        _market_status["open"] = is_open
+        _market_status["expires"] = time.monotonic() + MARKET_STATUS_CACHE_SECONDS
+        return is_open
+
+
+def seconds_until_market_open() -> float:
+    """0 if the market is open now, otherwise how long until the calendar's next session starts"""
+    if is_market_open():
+        return 0.0
+    return get_calendar().seconds_until_open()
 
 
 def get_all_share_prices_polygon_eod() -> dict[str, float]:
     """With much thanks to student Reema R. for fixing the timezone issue with this!"""
-    client = RESTClient(polygon_api_key)
+    client = get_client()
 
     probe = client.get_previous_close_agg("SPY")[0]
     last_close = datetime.fromtimestamp(probe.timestamp / 1000, tz=timezone.utc).date()
 
-    results = client.get_grouped_daily_aggs(last_close, adjusted=True, include_otc=False)
+    return get_all_share_prices_polygon_for_date(last_close)
+
+
+def get_all_share_prices_polygon_for_date(day: date) -> dict[str, float]:
+    client = get_client()
+    results = client.get_grouped_daily_aggs(day, adjusted=True, include_otc=False)
     return {result.ticker: result.close for result in results}
 
 
-@lru_cache(maxsize=2)
-def get_market_for_prior_date(today):
-    market_data = read_market(today)
-    if not market_data:
-        market_data = get_all_share_prices_polygon_eod()
-        write_market(today, market_data)
-    return market_data
+_loaded_dates = set()
+
+
+def get_market_for_prior_date(today: str) -> None:
+    """Make sure the prices as of the prior close are in the price store for this date"""
+    if today in _loaded_dates:
+        return
+    if not has_prices(today):
+        write_prices(today, get_all_share_prices_polygon_eod())
+    _loaded_dates.add(today)
+
+
+def backfill_market_history(start: date, end: date) -> int:
+    """
+    Store the prices as of the prior close for every trading day from start to end inclusive, skipping
+    dates already stored. Returns the number of dates added.
+    """
+    calendar = get_calendar()
+    added = 0
+    day = start
+    while day <= end:
+        key = day.strftime("%Y-%m-%d")
+        if calendar.is_trading_day(day) and not has_prices(key):
+            prior = day - timedelta(days=1)
+            prices = {}
+            for _ in range(5):
+                prices = get_all_share_prices_polygon_for_date(prior)
+                if prices:
+                    break
+                prior -= timedelta(days=1)
+            if prices:
+                write_prices(key, prices)
+                added += 1
+        day += timedelta(days=1)
+    return added
 
 
 def get_share_price_polygon_eod(symbol) -> float:
     today = datetime.now().date().strftime("%Y-%m-%d")
-    market_data = get_market_for_prior_date(today)
-    return market_data.get(symbol, 0.0)
+    get_market_for_prior_date(today)
+    return read_price(today, symbol) or 0.0
 
 
-def get_share_price_polygon_min(symbol) -> float:
-    client = RESTClient(polygon_api_key)
-    result = client.get_snapshot_ticker("stocks", symbol)
+def get_share_prices_polygon_eod(symbols: list[str]) -> dict[str, float]:
+    today = datetime.now().date().strftime("%Y-%m-%d")
+    get_market_for_prior_date(today)
+    prices = read_prices(today, symbols)
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
+
+
+def fetch_share_price_polygon_min(symbol) -> float:
+    result = get_client().get_snapshot_ticker("stocks", symbol)
     return result.min.close or result.prev_day.close
 
 
+def fetch_share_prices_polygon_min(symbols: list[str]) -> dict[str, float]:
+    results = get_client().get_snapshot_all("stocks", tickers=symbols)
+    prices = {result.ticker: result.min.close or result.prev_day.close for result in results}
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
+
+
+price_cache = PriceCache(fetch_share_price_polygon_min, fetch_share_prices_polygon_min)
+
+
+def price_cache_stats() -> dict[str, float]:
+    return price_cache.stats()
+
+
+def get_share_price_polygon_min(symbol) -> float:
+    return price_cache.get(symbol)
+
+
+def get_share_prices_polygon_min(symbols: list[str]) -> dict[str, float]:
+    return price_cache.get_many(symbols)
+
+
 def get_share_price_polygon(symbol) -> float:
     if is_paid_polygon:
         return get_share_price_polygon_min(symbol)
@@ -61,10 +245,35 @@ def get_share_price_polygon(symbol) -> float:
         return get_share_price_polygon_eod(symbol)
 
 
+def get_share_prices_polygon(symbols: list[str]) -> dict[str, float]:
+    if is_paid_polygon:
+        return get_share_prices_polygon_min(symbols)
+    else:
+        return get_share_prices_polygon_eod(symbols)
+
+
 def get_share_price(symbol) -> float:
+    if clock.is_simulated():
+        return read_price(clock.today(), symbol) or 0.0
     if polygon_api_key:
         try:
             return get_share_price_polygon(symbol)
         except Exception as e:
-            print(f"Was not able to use the polygon API due to {e}; using a random number")
-    return float(random.randint(1, 100))
+            print(f"Was not able to use the polygon API due to {e}; using the market simulator")
+    return market_simulator.price(symbol)
+
+
+def get_share_prices(symbols: list[str]) -> dict[str, float]:
+    """Prices for several symbols at once, in a single request or store lookup"""
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    if clock.is_simulated():
+        prices = read_prices(clock.today(), symbols)
+        return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
+    if polygon_api_key:
+        try:
+            return get_share_prices_polygon(symbols)
+        except Exception as e:
+            print(f"Was not able to use the polygon API due to {e}; using the market simulator")
+    return market_simulator.prices(symbols)
@@ -0,0 +1,78 @@
+import json
+import os
+import warnings
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+MARKET_CALENDAR_FILE = os.getenv(
+    "MARKET_CALENDAR_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "market_holidays.json")
+)
+
+
+class MarketCalendar:
+    """
+    Regular trading hours, holidays and early closes for the exchange, read from a local file
+    so that we can tell whether the market is open, and when it next opens, without a network call.
+    """
+
+    def __init__(self, path: str = MARKET_CALENDAR_FILE):
+        with open(path) as f:
+            calendar = json.load(f)
+        self.timezone = ZoneInfo(calendar["timezone"])
+        self.open_time = time.fromisoformat(calendar["open"])
+        self.close_time = time.fromisoformat(calendar["close"])
+        self.holidays = {date.fromisoformat(day) for day in calendar["holidays"]}
+        self.early_closes = {
+            date.fromisoformat(day): time.fromisoformat(close) for day, close in calendar["early_closes"].items()
+        }
+        # The file lists holidays a few years ahead; past its last year we can't tell holidays apart
+        self.last_year = max(day.year for day in self.holidays)
+
+    def is_trading_day(self, day: date) -> bool:
+        if day.year > self.last_year:
+            warnings.warn(
+                f"The market calendar only covers holidays up to {self.last_year}, so every weekday in {day.year} "
+                f"is treated as a trading day; add the holidays for {day.year} to {MARKET_CALENDAR_FILE}"
+            )
+        return day.weekday() < 5 and day not in self.holidays
+
+    def session(self, day: date) -> tuple[datetime, datetime]:
+        """The open and close of the trading session on this day, in the exchange's timezone"""
+        close_time = self.early_closes.get(day, self.close_time)
+        return (
+            datetime.combine(day, self.open_time, tzinfo=self.timezone),
+            datetime.combine(day, close_time, tzinfo=self.timezone),
+        )
+
+    def local_now(self, now: datetime | None = None) -> datetime:
+        return (now or datetime.now(self.timezone)).astimezone(self.timezone)
+
+    def is_open(self, now: datetime | None = None) -> bool:
+        now = self.local_now(now)
+        if not self.is_trading_day(now.date()):
+            return False
+        session_open, session_close = self.session(now.date())
+        return session_open <= now < session_close
+
+    def next_open(self, now: datetime | None = None) -> datetime:
+        """The start of the next trading session; now itself if the market is open"""
+        now = self.local_now(now)
+        if self.is_open(now):
+            return now
+        day = now.date()
+        while True:
+            if self.is_trading_day(day):
+                session_open, _ = self.session(day)
+                if session_open > now:
+                    return session_open
+            day += timedelta(days=1)
+
+    def seconds_until_open(self, now: datetime | None = None) -> float:
+        now = self.local_now(now)
+        return (self.next_open(now) - now).total_seconds()
+
+
+@lru_cache(maxsize=1)
+def get_calendar() -> MarketCalendar:
+    return MarketCalendar()
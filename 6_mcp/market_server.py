@@ -1,7 +1,15 @@
+import os
+import sys
+import asyncio
+import json
 from mcp.server.fastmcp import FastMCP
-from market import get_share_price
+from market import get_share_price, get_share_prices, price_cache_stats
+from database import flush_logs_on_terminate
 
-mcp = FastMCP("market_server")
+# Run with no arguments for stdio, or `uv run market_server.py streamable-http` to serve it over HTTP
+# on MARKET_SERVER_PORT (default 8002) so that many processes can share one warm server
+
+mcp = FastMCP("market_server", host=os.getenv("MCP_SERVER_HOST", "127.0.0.1"), port=int(os.getenv("MARKET_SERVER_PORT", "8002")))
 
 @mcp.tool()
 async def lookup_share_price(symbol: str) -> float:
@@ -10,7 +18,21 @@ async def lookup_share_price(symbol: str) -> float:
     Args:
         symbol: the symbol of the stock
     """
-    return get_share_price(symbol)
+    return await asyncio.to_thread(get_share_price, symbol)
+
+@mcp.tool()
+async def lookup_share_prices(symbols: list[str]) -> dict[str, float]:
+    """This tool provides the current prices of several stock symbols in one lookup.
+
+    Args:
+        symbols: the symbols of the stocks
+    """
+    return await asyncio.to_thread(get_share_prices, symbols)
+
+@mcp.resource("market://price_cache")
+async def read_price_cache_stats() -> str:
+    return json.dumps(price_cache_stats())
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
\ No newline at end of file
+    flush_logs_on_terminate()
+    mcp.run(transport=sys.argv[1] if len(sys.argv) > 1 else "stdio")
\ No newline at end of file
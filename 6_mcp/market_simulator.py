@@ -0,0 +1,135 @@
+import os
+import threading
+import zlib
+from datetime import date, datetime, time, timedelta
+import numpy as np
+import clock
+
+# Simulated share prices, for running the floor without a Polygon API key.
+# Every symbol follows a geometric Brownian motion with one step per calendar day; its daily shocks
+# mix the shocks of its sector with its own, so symbols in a sector move together. Between daily
+# steps the price moves smoothly from one day's close to the next. Everything is derived from the
+# seed and the symbol name, so every process sees the same price for a symbol at the same moment.
+
+MARKET_SIMULATOR_SEED = int(os.getenv("MARKET_SIMULATOR_SEED", "42"))
+MARKET_SIMULATOR_START = date.fromisoformat(os.getenv("MARKET_SIMULATOR_START", "2025-01-01"))
+SECTOR_CORRELATION = float(os.getenv("MARKET_SIMULATOR_SECTOR_CORRELATION", "0.5"))
+SECTORS = ["technology", "financials", "healthcare", "energy", "consumer", "industrials", "utilities", "materials"]
+DAYS_PER_YEAR = 365
+PATH_CHUNK_DAYS = 365
+
+
+def _key(text: str) -> int:
+    return zlib.crc32(text.encode())
+
+
+class MarketSimulator:
+    def __init__(
+        self,
+        seed: int = MARKET_SIMULATOR_SEED,
+        start: date = MARKET_SIMULATOR_START,
+        sector_correlation: float = SECTOR_CORRELATION,
+        sectors: list[str] = SECTORS,
+    ):
+        self.seed = seed
+        self.start = datetime.combine(start, time())
+        self.sector_correlation = sector_correlation
+        self.sectors = sectors
+        self.lock = threading.Lock()
+        self.days = 0
+        self.symbols: dict[str, int] = {}
+        self.initial_prices = np.empty(0)
+        self.drifts = np.empty(0)
+        self.volatilities = np.empty(0)
+        self.sector_indexes = np.empty(0, dtype=int)
+        # Cumulative log return of each symbol (rows) at the close of each day since the start (columns)
+        self.paths = np.zeros((0, 1))
+
+    def profile(self, symbol: str) -> tuple[int, float, float, float]:
+        """The sector index, starting price, annual drift and annual volatility of a symbol"""
+        rng = np.random.default_rng([self.seed, _key(symbol)])
+        sector = int(rng.integers(len(self.sectors)))
+        price = float(np.exp(rng.uniform(np.log(5), np.log(500))))
+        return sector, round(price, 2), float(rng.normal(0.07, 0.05)), float(rng.uniform(0.15, 0.6))
+
+    def _sector_shocks(self, days: int) -> np.ndarray:
+        return np.stack([
+            np.random.default_rng([self.seed, _key(sector), 1]).standard_normal(days) for sector in self.sectors
+        ])
+
+    def _simulate(self, symbols: list[str], sectors: np.ndarray, drifts: np.ndarray, volatilities: np.ndarray, days: int) -> np.ndarray:
+        """Paths of the given symbols over the first days steps, with a leading zero column"""
+        own = np.stack([np.random.default_rng([self.seed, _key(symbol), 2]).standard_normal(days) for symbol in symbols])
+        rho = self.sector_correlation
+        shocks = np.sqrt(rho) * self._sector_shocks(days)[sectors] + np.sqrt(1 - rho) * own
+        dt = 1 / DAYS_PER_YEAR
+        steps = ((drifts - volatilities**2 / 2) * dt)[:, None] + (volatilities * np.sqrt(dt))[:, None] * shocks
+        return np.hstack([np.zeros((len(symbols), 1)), np.cumsum(steps, axis=1)])
+
+    def _ensure(self, symbols: list[str], day: int) -> np.ndarray:
+        """Make sure every symbol has a path covering this day; returns their row indexes"""
+        with self.lock:
+            if day + 1 >= self.days:
+                self.days = (day + 1) // PATH_CHUNK_DAYS * PATH_CHUNK_DAYS + PATH_CHUNK_DAYS
+                if self.symbols:
+                    self.paths = self._simulate(list(self.symbols), self.sector_indexes, self.drifts, self.volatilities, self.days)
+            new = [symbol for symbol in dict.fromkeys(symbols) if symbol not in self.symbols]
+            if new:
+                sectors, initial_prices, drifts, volatilities = (np.array(values) for values in zip(*map(self.profile, new)))
+                paths = self._simulate(new, sectors, drifts, volatilities, self.days)
+                self.sector_indexes = np.append(self.sector_indexes, sectors).astype(int)
+                self.initial_prices = np.append(self.initial_prices, initial_prices)
+                self.drifts = np.append(self.drifts, drifts)
+                self.volatilities = np.append(self.volatilities, volatilities)
+                self.paths = np.vstack([self.paths.reshape(-1, self.days + 1), paths])
+                for symbol in new:
+                    self.symbols[symbol] = len(self.symbols)
+            return np.array([self.symbols[symbol] for symbol in symbols], dtype=int)
+
+    def prices(self, symbols: list[str], moment: datetime | None = None) -> dict[str, float]:
+        """Prices of the symbols at this moment (the trading clock by default)"""
+        if not symbols:
+            return {}
+        elapsed = max(0.0, ((moment or clock.now()) - self.start) / timedelta(days=1))
+        day, fraction = int(elapsed), elapsed % 1
+        rows = self._ensure(symbols, day)
+        paths = self.paths[rows]
+        log_returns = paths[:, day] * (1 - fraction) + paths[:, day + 1] * fraction
+        prices = np.round(self.initial_prices[rows] * np.exp(log_returns), 2)
+        return dict(zip(symbols, prices.tolist()))
+
+    def price(self, symbol: str, moment: datetime | None = None) -> float:
+        return self.prices([symbol], moment)[symbol]
+
+    def sector(self, symbol: str) -> str:
+        return self.sectors[self.profile(symbol)[0]]
+
+
+def universe(size: int, prefix: str = "SIM") -> list[str]:
+    """Made-up ticker symbols, for trying the floor against a large market"""
+    width = len(str(size - 1))
+    return [f"{prefix}{i:0{width}d}" for i in range(size)]
+
+
+def simulate_ticks(symbols: list[str], ticks: int, tick_seconds: float = 60, seed: int = MARKET_SIMULATOR_SEED,
+                   sector_correlation: float = SECTOR_CORRELATION) -> np.ndarray:
+    """
+    A standalone (symbols x ticks) matrix of prices at tick_seconds intervals, generated in one pass,
+    for load testing; these paths are independent of the daily paths behind prices()
+    """
+    simulator = MarketSimulator(seed=seed, sector_correlation=sector_correlation)
+    profiles = [simulator.profile(symbol) for symbol in symbols]
+    sectors = np.array([profile[0] for profile in profiles], dtype=int)
+    initial_prices = np.array([profile[1] for profile in profiles])
+    drifts = np.array([profile[2] for profile in profiles])
+    volatilities = np.array([profile[3] for profile in profiles])
+    rng = np.random.default_rng(seed)
+    rho = sector_correlation
+    shocks = np.sqrt(rho) * rng.standard_normal((len(simulator.sectors), ticks))[sectors]
+    shocks += np.sqrt(1 - rho) * rng.standard_normal((len(symbols), ticks))
+    dt = tick_seconds / (DAYS_PER_YEAR * 24 * 60 * 60)
+    steps = ((drifts - volatilities**2 / 2) * dt)[:, None] + (volatilities * np.sqrt(dt))[:, None] * shocks
+    return initial_prices[:, None] * np.exp(np.cumsum(steps, axis=1))
+
+
+market_simulator = MarketSimulator()
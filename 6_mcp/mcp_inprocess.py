@@ -0,0 +1,62 @@
+import importlib
+from contextlib import AsyncExitStack, asynccontextmanager
+import mcp
+from mcp.shared.memory import create_connected_server_and_client_session
+from agents.mcp import MCPServer
+
+
+@asynccontextmanager
+async def inprocess_session(module: str):
+    """A client session connected over in-memory streams to the FastMCP server defined in the given module"""
+    server = importlib.import_module(module).mcp
+    async with create_connected_server_and_client_session(server._mcp_server) as session:
+        yield session
+
+
+class InProcessMCPServer(MCPServer):
+    """
+    One of our own FastMCP servers mounted in this process. Requests go over in-memory streams
+    rather than through a subprocess's stdin and stdout, so there is no process to spawn and no
+    JSON encoding on each tool call.
+    """
+
+    def __init__(self, module: str, cache_tools_list: bool = False):
+        super().__init__()
+        self.module = module
+        self.cache_tools_list = cache_tools_list
+        self.exit_stack = AsyncExitStack()
+        self.session: mcp.ClientSession | None = None
+        self.tools_list = None
+
+    @property
+    def name(self) -> str:
+        return f"inprocess: {self.module}"
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.cleanup()
+
+    async def connect(self) -> None:
+        self.session = await self.exit_stack.enter_async_context(inprocess_session(self.module))
+
+    async def cleanup(self) -> None:
+        await self.exit_stack.aclose()
+        self.session = None
+
+    async def list_tools(self, run_context=None, agent=None):
+        if self.cache_tools_list and self.tools_list is not None:
+            return self.tools_list
+        self.tools_list = (await self.session.list_tools()).tools
+        return self.tools_list
+
+    async def call_tool(self, tool_name: str, arguments: dict | None):
+        return await self.session.call_tool(tool_name, arguments)
+
+    async def list_prompts(self):
+        return await self.session.list_prompts()
+
+    async def get_prompt(self, name: str, arguments: dict | None = None):
+        return await self.session.get_prompt(name, arguments)
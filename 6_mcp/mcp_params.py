@@ -7,40 +7,65 @@ load_dotenv(override=True)
 brave_env = {"BRAVE_API_KEY": os.getenv("BRAVE_API_KEY")}
 polygon_api_key = os.getenv("POLYGON_API_KEY")
 
+# Our own servers (accounts, push, market) run as stdio subprocesses by default, for isolation.
+# Set MCP_TRANSPORT=inprocess to mount them in this process over an in-memory transport instead.
+# Set ACCOUNTS_MCP_URL or MARKET_MCP_URL (e.g. http://localhost:8001/mcp) to use an already running
+# streamable-http server, shared by every process that points at it.
+
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio").strip().lower()
+accounts_mcp_url = os.getenv("ACCOUNTS_MCP_URL")
+market_mcp_url = os.getenv("MARKET_MCP_URL")
+
+
+def local_server_params(module: str, url: str | None = None) -> dict:
+    if url:
+        return {"url": url}
+    if MCP_TRANSPORT == "inprocess":
+        return {"inprocess": module}
+    return {"command": "uv", "args": ["run", f"{module}.py"]}
+
 # The MCP server for the Trader to read Market Data
 
-if is_paid_polygon or is_realtime_polygon:
+if market_mcp_url:
+    market_mcp = local_server_params("market_server", market_mcp_url)
+elif is_paid_polygon or is_realtime_polygon:
     market_mcp = {
         "command": "uvx",
         "args": ["--from", "git+https://github.com/polygon-io/mcp_polygon@v0.1.0", "mcp_polygon"],
         "env": {"POLYGON_API_KEY": polygon_api_key},
     }
 else:
-    market_mcp = {"command": "uv", "args": ["run", "market_server.py"]}
+    market_mcp = local_server_params("market_server")
 
 
 # The full set of MCP servers for the trader: Accounts, Push Notification and the Market
 
 trader_mcp_server_params = [
-    {"command": "uv", "args": ["run", "accounts_server.py"]},
-    {"command": "uv", "args": ["run", "push_server.py"]},
+    local_server_params("accounts_server", accounts_mcp_url),
+    local_server_params("push_server"),
     market_mcp,
 ]
 
 # The full set of MCP servers for the researcher: Fetch, Brave Search and Memory
+# Fetch and Brave Search hold no state, so can be shared by all traders; Memory is per trader
+
+researcher_shared_mcp_server_params = [
+    {"command": "uvx", "args": ["mcp-server-fetch"]},
+    {
+        "command": "npx",
+        "args": ["-y", "@modelcontextprotocol/server-brave-search"],
+        "env": brave_env,
+    },
+]
+
+
+def researcher_memory_mcp_server_params(name: str):
+    return {
+        "command": "npx",
+        "args": ["-y", "mcp-memory-libsql"],
+        "env": {"LIBSQL_URL": f"file:./memory/{name}.db"},
+    }
 
 
 def researcher_mcp_server_params(name: str):
-    return [
-        {"command": "uvx", "args": ["mcp-server-fetch"]},
-        {
-            "command": "npx",
-            "args": ["-y", "@modelcontextprotocol/server-brave-search"],
-            "env": brave_env,
-        },
-        {
-            "command": "npx",
-            "args": ["-y", "mcp-memory-libsql"],
-            "env": {"LIBSQL_URL": f"file:./memory/{name}.db"},
-        },
-    ]
+    return researcher_shared_mcp_server_params + [researcher_memory_mcp_server_params(name)]
@@ -0,0 +1,179 @@
+import asyncio
+import os
+from collections import OrderedDict
+from agents.mcp import MCPServer, MCPServerStdio, MCPServerStreamableHttp
+from mcp_inprocess import InProcessMCPServer
+from mcp_params import (
+    trader_mcp_server_params,
+    researcher_shared_mcp_server_params,
+    researcher_memory_mcp_server_params,
+)
+
+CLIENT_SESSION_TIMEOUT_SECONDS = 120
+HEALTH_CHECK_SECONDS = 30
+HEALTH_CHECK_TIMEOUT_SECONDS = 10
+START_TIMEOUT_SECONDS = 120
+RESTART_DELAY_SECONDS = 5
+# Memory servers kept running while no trader is using them, most recently used first
+IDLE_MEMORY_SERVERS = int(os.getenv("IDLE_MEMORY_SERVERS", "4"))
+
+
+def create_mcp_server(params: dict, cache_tools_list: bool = False) -> MCPServer:
+    if "inprocess" in params:
+        return InProcessMCPServer(params["inprocess"], cache_tools_list=cache_tools_list)
+    if "url" in params:
+        return MCPServerStreamableHttp(
+            params,
+            client_session_timeout_seconds=CLIENT_SESSION_TIMEOUT_SECONDS,
+            cache_tools_list=cache_tools_list,
+        )
+    return MCPServerStdio(
+        params,
+        client_session_timeout_seconds=CLIENT_SESSION_TIMEOUT_SECONDS,
+        cache_tools_list=cache_tools_list,
+    )
+
+
+def describe(params: dict) -> str:
+    if "inprocess" in params:
+        return f"{params['inprocess']} (in-process)"
+    if "url" in params:
+        return params["url"]
+    return " ".join([params.get("command", ""), *params.get("args", [])]).strip()
+
+
+class ManagedServer:
+    """
+    One long-lived MCP server, owned by a dedicated task so that it is connected and cleaned up
+    in the same task. The task pings the server periodically and restarts it if it stops responding.
+    """
+
+    def __init__(self, params: dict):
+        self.params = params
+        self.server = None
+        self.ready = asyncio.Event()
+        self.stopping = asyncio.Event()
+        self.task = None
+        self.restarts = 0
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def get(self) -> MCPServer:
+        self.start()
+        await asyncio.wait_for(self.ready.wait(), timeout=START_TIMEOUT_SECONDS)
+        return self.server
+
+    async def stop(self) -> None:
+        self.stopping.set()
+        if self.task is not None:
+            await self.task
+            self.task = None
+
+    async def _run(self) -> None:
+        while not self.stopping.is_set():
+            server = create_mcp_server(self.params, cache_tools_list=True)
+            try:
+                await server.connect()
+            except Exception as e:
+                print(f"Could not start MCP server {describe(self.params)}: {e}")
+                await self._sleep(RESTART_DELAY_SECONDS)
+                continue
+            self.server = server
+            self.ready.set()
+            try:
+                await self._watch(server)
+            finally:
+                self.ready.clear()
+                self.server = None
+                try:
+                    await server.cleanup()
+                except Exception as e:
+                    print(f"Error stopping MCP server {describe(self.params)}: {e}")
+            if not self.stopping.is_set():
+                self.restarts += 1
+                print(f"Restarting MCP server {describe(self.params)} (restart {self.restarts})")
+
+    async def _watch(self, server: MCPServer) -> None:
+        """Return when the pool is stopping or the server fails a health check"""
+        while not await self._sleep(HEALTH_CHECK_SECONDS):
+            try:
+                await asyncio.wait_for(server.session.send_ping(), timeout=HEALTH_CHECK_TIMEOUT_SECONDS)
+            except Exception as e:
+                print(f"MCP server {describe(self.params)} failed its health check: {e}")
+                return
+
+    async def _sleep(self, seconds: float) -> bool:
+        """Sleep, waking early if the pool is stopping; returns True if it is"""
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+        return self.stopping.is_set()
+
+
+class MCPServerPool:
+    """
+    The MCP servers for the whole trading floor, kept running across trading runs.
+    Stateless servers are shared by every trader. Each trader's memory server is leased by name
+    for a run and released after it; up to idle_memory_servers released ones are kept warm, and
+    the least recently used beyond that are stopped.
+    """
+
+    def __init__(
+        self,
+        trader_params: list[dict] = trader_mcp_server_params,
+        researcher_params: list[dict] = researcher_shared_mcp_server_params,
+        idle_memory_servers: int = IDLE_MEMORY_SERVERS,
+    ):
+        self.trader_servers = [ManagedServer(params) for params in trader_params]
+        self.researcher_servers = [ManagedServer(params) for params in researcher_params]
+        self.idle_memory_servers = idle_memory_servers
+        self.memory_servers: OrderedDict[str, ManagedServer] = OrderedDict()
+        self.leases: dict[str, int] = {}
+
+    async def __aenter__(self):
+        for managed in self.trader_servers + self.researcher_servers:
+            managed.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def get_trader_servers(self) -> list[MCPServer]:
+        return [await managed.get() for managed in self.trader_servers]
+
+    async def get_researcher_servers(self, name: str) -> list[MCPServer]:
+        """The researcher's servers, with a lease on its memory server; end it with release_researcher_servers"""
+        servers = [await managed.get() for managed in self.researcher_servers]
+        return servers + [await self.lease_memory_server(name)]
+
+    async def release_researcher_servers(self, name: str) -> None:
+        await self.release_memory_server(name)
+
+    async def lease_memory_server(self, name: str) -> MCPServer:
+        key = name.lower()
+        if key not in self.memory_servers:
+            self.memory_servers[key] = ManagedServer(researcher_memory_mcp_server_params(name))
+        self.memory_servers.move_to_end(key)
+        self.leases[key] = self.leases.get(key, 0) + 1
+        try:
+            return await self.memory_servers[key].get()
+        except BaseException:
+            await self.release_memory_server(name)
+            raise
+
+    async def release_memory_server(self, name: str) -> None:
+        """End a lease; if too many memory servers are now idle, stop the least recently used"""
+        key = name.lower()
+        self.leases[key] -= 1
+        if not self.leases[key]:
+            del self.leases[key]
+        idle = [key for key in self.memory_servers if key not in self.leases]
+        evicted = [self.memory_servers.pop(key) for key in idle[:max(0, len(idle) - self.idle_memory_servers)]]
+        await asyncio.gather(*[managed.stop() for managed in evicted], return_exceptions=True)
+
+    async def close(self) -> None:
+        everything = self.trader_servers + self.researcher_servers + list(self.memory_servers.values())
+        await asyncio.gather(*[managed.stop() for managed in everything], return_exceptions=True)
@@ -1,4 +1,5 @@
 import os
+import asyncio
 from dotenv import load_dotenv
 import requests
 from pydantic import BaseModel, Field
@@ -19,11 +20,11 @@ class PushModelArgs(BaseModel):
 
 
 @mcp.tool()
-def push(args: PushModelArgs):
+async def push(args: PushModelArgs):
     """Send a push notification with this brief message"""
     print(f"Push: {args.message}")
     payload = {"user": pushover_user, "token": pushover_token, "message": args.message}
-    requests.post(pushover_url, data=payload)
+    await asyncio.to_thread(requests.post, pushover_url, data=payload)
     return "Push notification sent"
 
 
@@ -0,0 +1,144 @@
+import asyncio
+import math
+import random
+import statistics
+from collections import deque
+from typing import Callable
+from traders import Trader
+from mcp_pool import MCPServerPool
+
+DURATION_HISTORY = 100
+
+
+class RunMetrics:
+    """Timing of one trader's scheduled runs: durations, lag behind schedule, timeouts and skipped slots"""
+
+    def __init__(self):
+        self.runs = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.durations = deque(maxlen=DURATION_HISTORY)
+        self.lags = deque(maxlen=DURATION_HISTORY)
+
+    def record(self, duration: float, lag: float, timed_out: bool) -> None:
+        self.runs += 1
+        self.timeouts += timed_out
+        self.durations.append(duration)
+        self.lags.append(lag)
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "runs": self.runs,
+            "timeouts": self.timeouts,
+            "skipped": self.skipped,
+            "last_duration": self.durations[-1] if self.durations else 0.0,
+            "mean_duration": statistics.mean(self.durations) if self.durations else 0.0,
+            "max_duration": max(self.durations, default=0.0),
+            "last_lag": self.lags[-1] if self.lags else 0.0,
+            "max_lag": max(self.lags, default=0.0),
+        }
+
+
+def describe(summary: dict[str, float]) -> str:
+    """One line for a trader's log from its RunMetrics summary"""
+    return (
+        f"{summary['runs']} runs taking {summary['mean_duration']:.0f}s on average and {summary['max_duration']:.0f}s at most, "
+        f"up to {summary['max_lag']:.1f}s behind schedule; {summary['timeouts']} timed out, {summary['skipped']} slots skipped"
+    )
+
+
+class TraderScheduler:
+    """
+    Runs each trader on its own cadence rather than in lockstep.
+    - At most max_concurrency traders run at once; the rest wait their turn
+    - Traders sharing a model are further limited by that model's budget in model_limits
+    - Each trader's first run is delayed by a random jitter so they don't all start together
+    - A run that exceeds the deadline is cancelled
+    - If a run overruns its next slot, that slot is skipped rather than queued up
+    - While the market is closed, traders sleep until it next opens rather than waking every slot
+    """
+
+    def __init__(
+        self,
+        traders: list[Trader],
+        pool: MCPServerPool | None,
+        interval_minutes: float,
+        intervals: dict[str, float] | None = None,
+        max_concurrency: int = 4,
+        model_limits: dict[str, int] | None = None,
+        jitter_seconds: float = 30,
+        deadline_minutes: float = 30,
+        should_run: Callable[[], bool] = lambda: True,
+        seconds_until_open: Callable[[], float] | None = None,
+    ):
+        self.traders = traders
+        self.pool = pool
+        self.interval_minutes = interval_minutes
+        self.intervals = {name.lower(): minutes for name, minutes in (intervals or {}).items()}
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.model_semaphores = {
+            model: asyncio.Semaphore(limit) for model, limit in (model_limits or {}).items()
+        }
+        self.jitter_seconds = jitter_seconds
+        self.deadline_seconds = deadline_minutes * 60
+        self.should_run = should_run
+        self.seconds_until_open = seconds_until_open
+        self.metrics = {trader.name: RunMetrics() for trader in traders}
+
+    def interval_seconds(self, trader: Trader) -> float:
+        return self.intervals.get(trader.name.lower(), self.interval_minutes) * 60
+
+    def model_semaphore(self, trader: Trader) -> asyncio.Semaphore | None:
+        return self.model_semaphores.get(trader.model_name)
+
+    async def run(self) -> None:
+        await asyncio.gather(*[self.run_trader(trader) for trader in self.traders])
+
+    async def run_trader(self, trader: Trader) -> None:
+        loop = asyncio.get_running_loop()
+        interval = self.interval_seconds(trader)
+        metrics = self.metrics[trader.name]
+        next_run = loop.time() + random.uniform(0, self.jitter_seconds)
+        while True:
+            await asyncio.sleep(max(0.0, next_run - loop.time()))
+            if await asyncio.to_thread(self.should_run):
+                await self.run_once(trader, next_run)
+            else:
+                wait = await asyncio.to_thread(self.seconds_until_open) if self.seconds_until_open else 0.0
+                if wait > interval:
+                    print(f"Market is closed; {trader.name} will run again when it opens in {wait / 3600:.1f} hours")
+                    next_run = loop.time() + wait + random.uniform(0, self.jitter_seconds)
+                    continue
+                print(f"Market is closed, skipping run for {trader.name}")
+            next_run += interval
+            behind = loop.time() - next_run
+            if behind > 0:
+                missed = math.ceil(behind / interval)
+                metrics.skipped += missed
+                next_run += missed * interval
+                print(f"{trader.name} overran its schedule; skipping {missed} run(s)")
+
+    async def run_once(self, trader: Trader, scheduled: float) -> None:
+        model_semaphore = self.model_semaphore(trader)
+        if model_semaphore is None:
+            await self.run_limited(trader, scheduled)
+        else:
+            async with model_semaphore:
+                await self.run_limited(trader, scheduled)
+
+    async def run_limited(self, trader: Trader, scheduled: float) -> None:
+        loop = asyncio.get_running_loop()
+        async with self.semaphore:
+            start = loop.time()
+            timed_out = False
+            try:
+                await asyncio.wait_for(trader.run(self.pool), timeout=self.deadline_seconds)
+            except asyncio.TimeoutError:
+                timed_out = True
+                print(f"{trader.name} exceeded the {self.deadline_seconds / 60:.0f} minute deadline and was cancelled")
+            duration = loop.time() - start
+            self.metrics[trader.name].record(duration, start - scheduled, timed_out)
+            print(f"{trader.name} finished in {duration:.0f}s, {start - scheduled:.1f}s behind schedule")
+
+    def report(self) -> dict[str, dict[str, float]]:
+        return {name: metrics.summary() for name, metrics in self.metrics.items()}
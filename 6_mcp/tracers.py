@@ -1,5 +1,5 @@
-from agents import TracingProcessor, Trace, Span
-from database import write_log
+from agents import TracingProcessor, Trace, Span, Usage
+from database import write_log, flush_logs, write_usage
 import secrets
 import string
 
@@ -15,7 +15,22 @@ def make_trace_id(tag: str) -> str:
     random_suffix = ''.join(secrets.choice(ALPHANUM) for _ in range(pad_len))
     return f"trace_{tag}{random_suffix}"
 
+def record_usage(name: str, run: str, usage: Usage) -> None:
+    """Store the tokens used by a trading run (the trader's and its researcher's), and log how much was cached"""
+    cached_tokens = usage.input_tokens_details.cached_tokens
+    write_usage(name, run, usage.requests, usage.input_tokens, cached_tokens, usage.output_tokens)
+    cached = cached_tokens / usage.input_tokens if usage.input_tokens else 0
+    write_log(
+        name,
+        "usage",
+        f"{usage.requests} requests, {usage.input_tokens} input tokens ({cached:.0%} cached), {usage.output_tokens} output tokens",
+    )
+
+
 class LogTracer(TracingProcessor):
+    """
+    Writes each trader's traces and spans to the logs table.
+    """
 
     def get_name(self, trace_or_span: Trace | Span) -> str | None:
         trace_id = trace_or_span.trace_id
@@ -69,7 +84,7 @@ class LogTracer(TracingProcessor):
             write_log(name, type, message)
 
     def force_flush(self) -> None:
-        pass
+        flush_logs()
 
     def shutdown(self) -> None:
-        pass
\ No newline at end of file
+        flush_logs()
\ No newline at end of file
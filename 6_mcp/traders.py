@@ -1,12 +1,12 @@
 from contextlib import AsyncExitStack
 from accounts_client import read_accounts_resource, read_strategy_resource
-from tracers import make_trace_id
-from agents import Agent, Tool, Runner, OpenAIChatCompletionsModel, trace
+from tracers import make_trace_id, record_usage
+from agents import Agent, Tool, Runner, RunResult, OpenAIChatCompletionsModel, Usage, ItemHelpers, trace
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import os
 import json
-from agents.mcp import MCPServerStdio
+from mcp_pool import MCPServerPool, create_mcp_server
 from templates import (
     researcher_instructions,
     trader_instructions,
@@ -59,9 +59,16 @@ async def get_researcher(mcp_servers, model_name) -> Agent:
     return researcher
 
 
-async def get_researcher_tool(mcp_servers, model_name) -> Tool:
+async def get_researcher_tool(mcp_servers, model_name, usage: Usage | None = None) -> Tool:
+    """The researcher as a tool; if usage is given, the tokens of every research run are added to it"""
     researcher = await get_researcher(mcp_servers, model_name)
-    return researcher.as_tool(tool_name="Researcher", tool_description=research_tool())
+
+    async def extract_output(result: RunResult) -> str:
+        if usage is not None:
+            usage.add(result.context_wrapper.usage)
+        return ItemHelpers.text_message_outputs(result.new_items)
+
+    return researcher.as_tool(tool_name="Researcher", tool_description=research_tool(), custom_output_extractor=extract_output)
 
 
 class Trader:
@@ -71,9 +78,15 @@ class Trader:
         self.agent = None
         self.model_name = model_name
         self.do_trade = True
+        self.usage = Usage()
+
+    def trace_name(self) -> str:
+        return f"{self.name}-trading" if self.do_trade else f"{self.name}-rebalancing"
 
     async def create_agent(self, trader_mcp_servers, researcher_mcp_servers) -> Agent:
-        tool = await get_researcher_tool(researcher_mcp_servers, self.model_name)
+        # A fresh total per run, which the researcher adds its own runs to
+        self.usage = Usage()
+        tool = await get_researcher_tool(researcher_mcp_servers, self.model_name, self.usage)
         self.agent = Agent(
             name=self.name,
             instructions=trader_instructions(self.name),
@@ -83,8 +96,8 @@ class Trader:
         )
         return self.agent
 
-    async def get_account_report(self) -> str:
-        account = await read_accounts_resource(self.name)
+    async def get_account_report(self, full: bool = False) -> str:
+        account = await read_accounts_resource(self.name, full)
         account_json = json.loads(account)
         account_json.pop("portfolio_value_time_series", None)
         return json.dumps(account_json)
@@ -98,34 +111,40 @@ class Trader:
             if self.do_trade
             else rebalance_message(self.name, strategy, account)
         )
-        await Runner.run(self.agent, message, max_turns=MAX_TURNS)
-
-    async def run_with_mcp_servers(self):
+        result = await Runner.run(self.agent, message, max_turns=MAX_TURNS)
+        # Taken from the run rather than the trace, because Chat Completions models leave cached tokens off their spans
+        self.usage.add(result.context_wrapper.usage)
+        record_usage(self.name, self.trace_name(), self.usage)
+
+    async def run_with_mcp_servers(self, pool: MCPServerPool | None = None):
+        if pool:
+            trader_mcp_servers = await pool.get_trader_servers()
+            researcher_mcp_servers = await pool.get_researcher_servers(self.name)
+            try:
+                await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
+            finally:
+                await pool.release_researcher_servers(self.name)
+            return
         async with AsyncExitStack() as stack:
             trader_mcp_servers = [
-                await stack.enter_async_context(
-                    MCPServerStdio(params, client_session_timeout_seconds=120)
-                )
+                await stack.enter_async_context(create_mcp_server(params))
                 for params in trader_mcp_server_params
             ]
             async with AsyncExitStack() as stack:
                 researcher_mcp_servers = [
-                    await stack.enter_async_context(
-                        MCPServerStdio(params, client_session_timeout_seconds=120)
-                    )
+                    await stack.enter_async_context(create_mcp_server(params))
                     for params in researcher_mcp_server_params(self.name)
                 ]
                 await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
 
-    async def run_with_trace(self):
-        trace_name = f"{self.name}-trading" if self.do_trade else f"{self.name}-rebalancing"
+    async def run_with_trace(self, pool: MCPServerPool | None = None):
         trace_id = make_trace_id(f"{self.name.lower()}")
-        with trace(trace_name, trace_id=trace_id):
-            await self.run_with_mcp_servers()
+        with trace(self.trace_name(), trace_id=trace_id):
+            await self.run_with_mcp_servers(pool)
 
-    async def run(self):
+    async def run(self, pool: MCPServerPool | None = None):
         try:
-            await self.run_with_trace()
+            await self.run_with_trace(pool)
         except Exception as e:
             print(f"Error running trader {self.name}: {e}")
         self.do_trade = not self.do_trade
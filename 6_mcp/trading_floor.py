@@ -1,9 +1,15 @@
 from traders import Trader
 from typing import List
 import asyncio
+import math
+import multiprocessing
 from tracers import LogTracer
 from agents import add_trace_processor
-from market import is_market_open
+from market import is_market_open, seconds_until_market_open, get_share_prices
+from database import archive_logs, write_trader, read_traders, account_version, write_log
+from accounts import Account
+from mcp_pool import MCPServerPool
+from scheduler import TraderScheduler, describe
 from dotenv import load_dotenv
 import os
 
@@ -14,41 +20,195 @@ RUN_EVEN_WHEN_MARKET_IS_CLOSED = (
     os.getenv("RUN_EVEN_WHEN_MARKET_IS_CLOSED", "false").strip().lower() == "true"
 )
 USE_MANY_MODELS = os.getenv("USE_MANY_MODELS", "false").strip().lower() == "true"
+MAX_CONCURRENT_TRADERS = int(os.getenv("MAX_CONCURRENT_TRADERS", "4"))
+START_JITTER_SECONDS = float(os.getenv("START_JITTER_SECONDS", "30"))
+RUN_DEADLINE_MINUTES = float(os.getenv("RUN_DEADLINE_MINUTES", "30"))
+VALUE_EVERY_N_MINUTES = float(os.getenv("VALUE_EVERY_N_MINUTES", str(RUN_EVERY_N_MINUTES)))
+TRADING_FLOOR_WORKERS = int(os.getenv("TRADING_FLOOR_WORKERS", "1"))
+DEFAULT_MODEL_CONCURRENCY = int(os.getenv("DEFAULT_MODEL_CONCURRENCY", "4"))
+SCHEDULE_REPORT_MINUTES = float(os.getenv("SCHEDULE_REPORT_MINUTES", str(RUN_EVERY_N_MINUTES)))
 
-names = ["Warren", "George", "Ray", "Cathie"]
-lastnames = ["Patience", "Bold", "Systematic", "Crypto"]
+
+def parse_mapping(value: str, convert) -> dict:
+    """Parse settings written like "Warren=120,Cathie=30" """
+    return {
+        key.strip(): convert(setting)
+        for key, setting in (entry.split("=", 1) for entry in value.split(",") if "=" in entry)
+    }
+
+
+# Per-trader cadences override RUN_EVERY_N_MINUTES, written like "Warren=120,Cathie=30"
+TRADER_RUN_EVERY_N_MINUTES = parse_mapping(os.getenv("TRADER_RUN_EVERY_N_MINUTES", ""), float)
+
+# How many traders using each model may run at once across the whole floor, like "gpt-4o-mini=8,deepseek-chat=2"
+MODEL_CONCURRENCY = parse_mapping(os.getenv("MODEL_CONCURRENCY", ""), int)
+
+default_names = ["Warren", "George", "Ray", "Cathie"]
+default_lastnames = ["Patience", "Bold", "Systematic", "Crypto"]
 
 if USE_MANY_MODELS:
-    model_names = [
+    default_model_names = [
         "gpt-4.1-mini",
         "deepseek-chat",
         "gemini-2.5-flash-preview-04-17",
         "grok-3-mini-beta",
     ]
-    short_model_names = ["GPT 4.1 Mini", "DeepSeek V3", "Gemini 2.5 Flash", "Grok 3 Mini"]
+    default_short_model_names = ["GPT 4.1 Mini", "DeepSeek V3", "Gemini 2.5 Flash", "Grok 3 Mini"]
 else:
-    model_names = ["gpt-4o-mini"] * 4
-    short_model_names = ["GPT 4o mini"] * 4
+    default_model_names = ["gpt-4o-mini"] * 4
+    default_short_model_names = ["GPT 4o mini"] * 4
+
+
+def register_trader(
+    name: str,
+    lastname: str,
+    model_name: str,
+    short_model_name: str | None = None,
+    strategy: str | None = None,
+    run_every_n_minutes: float | None = None,
+) -> None:
+    """Add a trader to the registry (or update it); a new account starts with the given strategy"""
+    write_trader(name, lastname, model_name, short_model_name or model_name, run_every_n_minutes)
+    if strategy is not None and account_version(name) is None:
+        Account.get(name).reset(strategy)
+
+
+def register_simulated_traders(count: int, model_name: str, strategy: str, prefix: str = "Sim") -> None:
+    """Register a batch of identical traders, named like Sim001, for running the floor at scale"""
+    width = len(str(count))
+    for i in range(1, count + 1):
+        register_trader(f"{prefix}{i:0{width}d}", "Simulated", model_name, strategy=strategy)
 
 
-def create_traders() -> List[Trader]:
+def seed_default_traders() -> None:
+    """Keep the four original traders registered, with the models chosen by USE_MANY_MODELS"""
+    registered = {trader["name"].lower(): trader for trader in read_traders(active_only=False)}
+    for name, lastname, model_name, short_model_name in zip(
+        default_names, default_lastnames, default_model_names, default_short_model_names
+    ):
+        existing = registered.get(name.lower())
+        if not existing or existing["model_name"] != model_name:
+            write_trader(
+                name,
+                lastname,
+                model_name,
+                short_model_name,
+                existing["run_every_n_minutes"] if existing else None,
+                bool(existing["active"]) if existing else True,
+            )
+
+
+def load_registry() -> list[dict]:
+    """The active traders as registered now, in the order they were registered; reading it writes nothing"""
+    return read_traders()
+
+
+def create_traders(registry: list[dict], shard: int = 0, shards: int = 1) -> List[Trader]:
     traders = []
-    for name, lastname, model_name in zip(names, lastnames, model_names):
-        traders.append(Trader(name, lastname, model_name))
+    for trader in registry[shard::shards]:
+        traders.append(Trader(trader["name"], trader["lastname"], trader["model_name"]))
     return traders
 
 
-async def run_every_n_minutes():
-    add_trace_processor(LogTracer())
-    traders = create_traders()
+def trader_intervals(registry: list[dict]) -> dict[str, float]:
+    intervals = {
+        trader["name"]: trader["run_every_n_minutes"] for trader in registry if trader["run_every_n_minutes"]
+    }
+    return intervals | TRADER_RUN_EVERY_N_MINUTES
+
+
+def model_limits(registry: list[dict], shards: int) -> dict[str, int]:
+    """Each worker gets an equal share of every model's concurrency budget"""
+    model_names = {trader["model_name"] for trader in registry}
+    budgets = {model: MODEL_CONCURRENCY.get(model, DEFAULT_MODEL_CONCURRENCY) for model in model_names}
+    return {model: max(1, math.ceil(budget / shards)) for model, budget in budgets.items()}
+
+
+def should_run() -> bool:
+    return RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open()
+
+
+async def housekeeping():
     while True:
-        if RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open():
-            await asyncio.gather(*[trader.run() for trader in traders])
-        else:
-            print("Market is closed, skipping run")
+        archived = await asyncio.to_thread(archive_logs)
+        if archived:
+            print(f"Archived {archived} old log entries")
         await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
 
 
+async def schedule_reports(scheduler: TraderScheduler):
+    """Log each trader's run durations, lag and missed slots, so they show in the trader's log on the dashboard"""
+    while True:
+        await asyncio.sleep(SCHEDULE_REPORT_MINUTES * 60)
+        for name, summary in scheduler.report().items():
+            if summary["runs"] or summary["skipped"]:
+                write_log(name, "schedule", describe(summary))
+
+
+def record_portfolio_values() -> None:
+    """Add a point to every trader's portfolio value time series, pricing all their holdings in one lookup"""
+    accounts = [Account.get(trader["name"]) for trader in load_registry()]
+    prices = get_share_prices(sorted({symbol for account in accounts for symbol in account.holdings}))
+    for account in accounts:
+        account.record_portfolio_value(account.calculate_portfolio_value(prices))
+
+
+async def valuation():
+    """Portfolio values are recorded here, at a steady cadence, rather than whenever an account is read"""
+    while True:
+        if await asyncio.to_thread(should_run):
+            try:
+                await asyncio.to_thread(record_portfolio_values)
+            except Exception as e:
+                print(f"Error recording portfolio values: {e}")
+        await asyncio.sleep(VALUE_EVERY_N_MINUTES * 60)
+
+
+async def run_every_n_minutes(shard: int = 0, shards: int = 1):
+    add_trace_processor(LogTracer())
+    # Read here rather than at import, so each worker sees the traders registered when it starts
+    registry = load_registry()
+    traders = create_traders(registry, shard, shards)
+    max_concurrency = max(1, math.ceil(MAX_CONCURRENT_TRADERS / shards))
+    async with MCPServerPool(idle_memory_servers=max_concurrency) as pool:
+        scheduler = TraderScheduler(
+            traders,
+            pool,
+            interval_minutes=RUN_EVERY_N_MINUTES,
+            intervals=trader_intervals(registry),
+            max_concurrency=max_concurrency,
+            model_limits=model_limits(registry, shards),
+            jitter_seconds=START_JITTER_SECONDS,
+            deadline_minutes=RUN_DEADLINE_MINUTES,
+            should_run=should_run,
+            seconds_until_open=None if RUN_EVEN_WHEN_MARKET_IS_CLOSED else seconds_until_market_open,
+        )
+        tasks = [scheduler.run(), schedule_reports(scheduler)]
+        if shard == 0:
+            tasks += [housekeeping(), valuation()]
+        await asyncio.gather(*tasks)
+
+
+def run_worker(shard: int, shards: int) -> None:
+    asyncio.run(run_every_n_minutes(shard, shards))
+
+
+def run_workers(workers: int) -> None:
+    """Shard the registered traders across worker processes, each with its own scheduler and MCP servers"""
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker, args=(shard, workers), daemon=True) for shard in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
 if __name__ == "__main__":
-    print(f"Starting scheduler to run every {RUN_EVERY_N_MINUTES} minutes")
-    asyncio.run(run_every_n_minutes())
+    seed_default_traders()
+    registry = load_registry()
+    print(f"Starting scheduler for {len(registry)} traders to run every {RUN_EVERY_N_MINUTES} minutes")
+    workers = min(TRADING_FLOOR_WORKERS, len(registry))
+    if workers > 1:
+        run_workers(workers)
+    else:
+        asyncio.run(run_every_n_minutes())